@@ -1,17 +1,20 @@
 import json
 import logging
+import os
+import tempfile
 import threading
 
-from flask import Flask, request, render_template, make_response, send_file, redirect, url_for, jsonify
+from flask import Flask, Response, request, render_template, make_response, send_file, redirect, url_for, jsonify
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 
 from consts.sys_constants import SysConstants
 from engines.abbreviation import abbreviation_engine
-from engines.api_tree import api_tree_engine
+from engines.api_tree import api_catalog_store, api_tree_engine
 from engines.bb_contribution_analysis import bb_contribution_analysis_engine
 from engines.contacts import contacts_engine
 from engines.one_step import one_step_engine
-from common_tools import file_tools, image_tools, ip_tools, string_tools
+from common_tools import etag_tools, file_tools, image_tools, ip_tools, string_tools
 from engines.sql_generator import sql_generator_engine
 from engines.ui_marker import ui_marker_engine
 from jobs import ui_api_composer, cleaner_tools, bb_contribution_job
@@ -24,6 +27,8 @@ logging.basicConfig(level=logging.INFO, handlers=[
     logging.StreamHandler()
 ])
 log = logging.getLogger(__name__)
+# refresh ui_api_relation_data.json in the background when the markers of a page are changed
+ui_api_composer.start_ui_api_relation_worker()
 
 
 @app.route('/', methods=['GET'])
@@ -66,13 +71,19 @@ def upload_image():
         if uploaded_file_name != '':
             log.info(
                 f"[Uploaded Successful] Client address: [{ip_tools.get_ip_addr(request)}:{ip_tools.get_port(request)}] Uploaded image [{application_id}/{module_id}/{function_id}/{uploaded_file_name}]")
+            # the pages in the same function with the same screenshot, the UI can warn the user about them
+            duplicate_pages = ui_marker_engine.find_duplicate_pages(application_id, module_id, function_id, uploaded_file_name)
             return jsonify(
                 {"message": SysConstants.MSG_IMAGE_UPLOAD_SUCCESSFUL.value,
-                 "pageName": new_image_file_name}), SysConstants.HTTP_STATUS_OK.value
+                 "pageName": new_image_file_name,
+                 "duplicatePages": duplicate_pages}), SysConstants.HTTP_STATUS_OK.value
         else:
             log.info(
                 f"[Failed to Upload] Client address: [{ip_tools.get_ip_addr(request)}:{ip_tools.get_port(request)}] tried to upload image to an invalid folder [{application_id}/{module_id}/{function_id}]")
             return jsonify({"message": uploaded_file_name}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    except ValueError as e:
+        # the image is larger than the limit, it's found when it's saved if the client didn't send the size
+        return jsonify({"message": str(e)}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     except Exception as e:
         log.error(str(e))
         return jsonify({"message": SysConstants.MSG_IMAGE_UPLOAD_FAILED.value}), SysConstants.HTTP_STATUS_INTERNAL_SERVER_ERROR.value
@@ -110,6 +121,9 @@ def replace_image():
             log.info(
                 f"[Replaced Failed] Client address: [{ip_tools.get_ip_addr(request)}:{ip_tools.get_port(request)}] tried to replace image to an invalid folder [{application_id}/{module_id}/{function_id}]")
             return jsonify({"message": uploaded_file_name}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    except ValueError as e:
+        # the image is larger than the limit, it's found when it's saved if the client didn't send the size
+        return jsonify({"message": str(e)}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     except Exception as e:
         log.error(str(e))
         return jsonify({"message": SysConstants.MSG_IMAGE_UPLOAD_FAILED.value}), SysConstants.HTTP_STATUS_INTERNAL_SERVER_ERROR.value
@@ -125,8 +139,18 @@ def ui_marker_pages():
     if not all([application_id, module_id, function_id]):
         return jsonify({"status": SysConstants.STATUS_FAILED.value,
                         "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    # offset and limit are optional, all the pages are returned without them
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value,
+                        "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    if offset < 0 or (limit is not None and limit <= 0):
+        return jsonify({"status": SysConstants.STATUS_FAILED.value,
+                        "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
 
-    result = ui_marker_engine.get_function_pages(application_id, module_id, function_id)
+    result = ui_marker_engine.get_function_pages(application_id, module_id, function_id, offset, limit)
 
     if isinstance(result, dict) and result["status"] == "failed":
         return jsonify(result), SysConstants.HTTP_STATUS_NO_CONTENT.value
@@ -134,6 +158,36 @@ def ui_marker_pages():
     return jsonify(result), SysConstants.HTTP_STATUS_OK.value
 
 
+@app.route('/ui_marker/page_image', methods=['GET'])
+def get_page_image():
+    application_id = request.args.get('applicationId')
+    module_id = request.args.get('moduleId')
+    function_id = request.args.get('functionId')
+    page_name = request.args.get('pageName')
+    # thumbnail for the page list, preview for the marker canvas, original for download
+    size = request.args.get('size', SysConstants.IMAGE_SIZE_ORIGINAL.value)
+
+    if not all([application_id, module_id, function_id, page_name]) or \
+            (size != SysConstants.IMAGE_SIZE_ORIGINAL.value and size not in SysConstants.IMAGE_DERIVATIVE_SIZES.value):
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    if ui_marker_engine.pre_verify(application_id, module_id, function_id)["status"] == SysConstants.STATUS_FAILED.value:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+
+    image_file_path = ui_marker_engine.get_page_image(application_id, module_id, function_id, secure_filename(page_name), size)
+    if image_file_path is None:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": "No image files found"}), SysConstants.HTTP_STATUS_NOT_FOUND.value
+
+    # the etag is the hash of the content, the browser keeps the image and gets 304 until the image is changed
+    etag = etag_tools.get_file_etag(image_file_path)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = send_file(os.path.abspath(image_file_path), conditional=False, etag=False)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 @app.route('/ui_marker/page', methods=['DELETE'])
 def delete_page():
     application_id = request.args.get('applicationId')
@@ -287,6 +341,21 @@ def get_page_form_details():
     return jsonify(result), SysConstants.HTTP_STATUS_OK.value
 
 
+@app.route('/ui_marker/page_bundle', methods=['GET'])
+def get_page_bundle():
+    application_id = request.args.get('applicationId')
+    module_id = request.args.get('moduleId')
+    function_id = request.args.get('functionId')
+    page_name = request.args.get('pageName')
+
+    if not all([application_id, module_id, function_id, page_name]):
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+
+    # the canvas, the page form and all the element forms of the page in 1 call
+    result = ui_marker_engine.get_page_bundle(application_id, module_id, function_id, page_name)
+    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+
+
 @app.route('/ui_marker/marker_form_details', methods=['DELETE'])
 def delete_page_form_details():
     application_id = request.args.get('applicationId')
@@ -312,23 +381,23 @@ def delete_page_form_details():
 """===========================Contacts related functions start==========================="""
 @app.route('/contacts/locations', methods=['GET'])
 def get_locations():
-    # call contacts_engine.get_locations() to get the locations
-    result = contacts_engine.get_locations()
-    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+    # the etag is from the file, the client gets 304 if the locations are not changed
+    etag = etag_tools.get_file_etag(contacts_engine.get_location_file_path())
+    return etag_tools.build_json_response_with_etag(request, 'contacts_locations', etag, contacts_engine.get_locations)
 
 
 @app.route('/contacts/persons', methods=['GET'])
 def get_persons():
-    # call contacts_engine.get_persons() to get the persons
-    result = contacts_engine.get_persons()
-    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+    # the etag is from the file, the client gets 304 if the persons are not changed
+    etag = etag_tools.get_file_etag(contacts_engine.get_person_file_path())
+    return etag_tools.build_json_response_with_etag(request, 'contacts_persons', etag, contacts_engine.get_persons)
 
 
 @app.route('/contacts/teams', methods=['GET'])
 def get_teams():
-    # call contacts_engine.get_teams() to get the teams
-    result = contacts_engine.get_teams()
-    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+    # the etag is from the file, the client gets 304 if the teams are not changed
+    etag = etag_tools.get_file_etag(contacts_engine.get_team_file_path())
+    return etag_tools.build_json_response_with_etag(request, 'contacts_teams', etag, contacts_engine.get_teams)
 
 
 @app.route('/contacts/teams', methods=['POST'])
@@ -372,9 +441,9 @@ def export_person_info_to_excel():
 
 @app.route('/abbreviations', methods=['GET'])
 def get_abbreviations():
-    # call abbreviation_engine.get_abbreviations() to get the abbreviations
-    result = abbreviation_engine.get_abbreviations()
-    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+    # the etag is from the file, the client gets 304 if the abbreviations are not changed
+    etag = etag_tools.get_file_etag(abbreviation_engine.get_data_file_path())
+    return etag_tools.build_json_response_with_etag(request, 'abbreviations', etag, abbreviation_engine.get_abbreviations)
 
 
 @app.route('/abbreviations', methods=['POST'])
@@ -447,9 +516,9 @@ def download_vscode_plugin():
 
 @app.route('/api_tree/open_apis', methods=['GET'])
 def get_open_apis():
-    # call api_tree_engine.get_open_apis() to get the open apis
-    result = api_tree_engine.get_open_apis()
-    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+    # the etag is the version of the API catalog, the client gets 304 if no API is changed
+    etag = api_catalog_store.get_etag()
+    return etag_tools.build_json_response_with_etag(request, 'api_tree_open_apis', etag, api_tree_engine.get_open_apis)
 
 
 @app.route('/api_tree/open_apis', methods=['POST'])
@@ -459,17 +528,64 @@ def add_open_apis():
     # if open_apis is string, parst it to json
     if isinstance(open_apis, str):
         open_apis = json.loads(open_apis)
-    # call api_tree_engine.add_open_apis(open_apis) to add the open apis
-    api_tree_engine.add_open_apis(open_apis)
-    return jsonify({"status": SysConstants.STATUS_SUCCESS.value}), SysConstants.HTTP_STATUS_OK.value
+    # if open_apis is not an array, return the error message
+    if not isinstance(open_apis, list):
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    # call api_tree_engine.add_open_apis(open_apis) to add the open apis in 1 batch, the result of each api is returned
+    import_result = api_tree_engine.add_open_apis(open_apis, ip_tools.get_ip_addr(request))
+    return jsonify(import_result), SysConstants.HTTP_STATUS_OK.value
 
 
 @app.route('/api_tree/apis', methods=['GET'])
 def get_apis():
-    result = api_tree_engine.get_apis()
+    # the etag is the version of the API catalog, the client gets 304 if no API is changed
+    etag = api_catalog_store.get_etag()
+    return etag_tools.build_json_response_with_etag(request, 'api_tree_apis', etag, api_tree_engine.get_apis)
+
+
+@app.route('/api_tree/apis/tree', methods=['GET'])
+def get_api_tree_view():
+    # get the nested api tree, each api is expanded with its sub apis only once, see api_tree_engine.get_api_tree_view
+    result = api_tree_engine.get_api_tree_view()
     return jsonify(result), SysConstants.HTTP_STATUS_OK.value
 
 
+@app.route('/api_tree/apis/search', methods=['GET'])
+def search_apis():
+    # get the query params uri, httpMethod, classification, belongsToApplication, channel, swaggerTitle, apiName, same as the excel export
+    uri = request.args.get('uri')
+    uri_search_mode = request.args.get('uriSearchMode')
+    http_method = request.args.get('httpMethod')
+    classification = request.args.get('classification')
+    belongs_to_application = request.args.get('belongsToApplication')
+    channel = request.args.get('channel')
+    swagger_title = request.args.get('swaggerTitle')
+    api_name = request.args.get('apiName')
+    # get the sort and paging params, cursor is the nextCursor returned by the previous page
+    sort_by = request.args.get('sortBy', 'createTime')
+    sort_order = request.args.get('sortOrder', 'desc')
+    cursor = request.args.get('cursor')
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', SysConstants.API_SEARCH_DEFAULT_PAGE_SIZE.value))
+    except ValueError:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    if sort_by not in SysConstants.API_SEARCH_SORTABLE_FIELDS.value or offset < 0 or not 0 < limit <= SysConstants.API_SEARCH_MAX_PAGE_SIZE.value:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+
+    try:
+        result = api_tree_engine.search_apis(uri, uri_search_mode, http_method, classification, belongs_to_application, channel,
+                                             swagger_title, api_name, sort_by, sort_order, offset, limit, cursor)
+    except ValueError:
+        # the cursor can't be decoded, or the sortOrder is neither asc nor desc
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    response = make_response(jsonify(result), SysConstants.HTTP_STATUS_OK.value)
+    response.headers['X-Total-Count'] = str(result["total"])
+    # let the browser read X-Total-Count in the cross origin requests
+    response.headers['Access-Control-Expose-Headers'] = 'X-Total-Count'
+    return response
+
+
 @app.route('/api_tree/private_apis', methods=['GET'])
 def get_private_api_by_open_api_id():
     # get the open_api_id from request param
@@ -490,7 +606,7 @@ def add_api():
     if api_entity is None:
         return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
 
-    add_result = api_tree_engine.add_api(api_entity);
+    add_result = api_tree_engine.add_api(api_entity, ip_tools.get_ip_addr(request))
     if (add_result["status"] == "failed"):
         return jsonify(add_result), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     else:
@@ -504,7 +620,7 @@ def delete_api():
     # if id is null, return the error message
     if id is None:
         return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
-    delete_result = api_tree_engine.delete_api(id)
+    delete_result = api_tree_engine.delete_api(id, ip_tools.get_ip_addr(request))
     if delete_result["status"] == "failed":
         return jsonify(delete_result), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     else:
@@ -522,13 +638,36 @@ def update_api():
     if api_entity is None:
         return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
 
-    update_result = api_tree_engine.update_api(api_entity);
+    update_result = api_tree_engine.update_api(api_entity, ip_tools.get_ip_addr(request))
     if update_result["status"] == "failed":
         return jsonify(update_result), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     else:
         return jsonify(update_result), SysConstants.HTTP_STATUS_OK.value
 
 
+@app.route('/api_tree/api/parents', methods=['GET'])
+def get_parent_apis():
+    # get the param id from query param, and transitive=true to get all the callers up to the top level apis
+    id = request.args.get('id')
+    transitive = request.args.get('transitive') == "true"
+    # if id is null, return the error message
+    if id is None:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    parent_apis = api_tree_engine.get_parent_apis(id, transitive)
+    return jsonify({"status": SysConstants.STATUS_SUCCESS.value, "apis": parent_apis}), SysConstants.HTTP_STATUS_OK.value
+
+
+@app.route('/api_tree/api/history', methods=['GET'])
+def get_api_change_history():
+    # get the param id from query param
+    id = request.args.get('id')
+    # if id is null, return the error message
+    if id is None:
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    changes = api_tree_engine.get_api_change_history(id)
+    return jsonify({"status": SysConstants.STATUS_SUCCESS.value, "changes": changes}), SysConstants.HTTP_STATUS_OK.value
+
+
 @app.route('/api_tree/sub_api_ids', methods=['PUT'])
 def update_sub_apis():
     # get the id and subIds from request body
@@ -537,7 +676,7 @@ def update_sub_apis():
     # if id is null, return the error message
     if id is None:
         return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
-    update_result = api_tree_engine.update_sub_apis(id, sub_ids);
+    update_result = api_tree_engine.update_sub_apis(id, sub_ids, ip_tools.get_ip_addr(request))
     if update_result["status"] == "failed":
         return jsonify(update_result), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     else:
@@ -552,7 +691,7 @@ def delete_sub_api():
     # if id is null, return the error message
     if id is None or sub_id is None:
         return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
-    delete_result = api_tree_engine.delete_sub_api(id, sub_id)
+    delete_result = api_tree_engine.delete_sub_api(id, sub_id, ip_tools.get_ip_addr(request))
     if delete_result["status"] == "failed":
         return jsonify(delete_result), SysConstants.HTTP_STATUS_BAD_REQUEST.value
     else:
@@ -570,12 +709,35 @@ def export_api_info_to_excel():
     channel = request.args.get('channel')
     swagger_title = request.args.get('swaggerTitle')
     api_name = request.args.get('apiName')
-    # export the api info to excel
+    # get the export format, xlsx (default), csv or ndjson
+    export_format = request.args.get('format', 'xlsx').lower()
+    filter_params = (uri, uriSearchMode, http_method, classification, belongs_to_application, channel, swagger_title, api_name)
+    # the download file name is from the config, with the extension of the export format
     apis_excel_file_path = file_tools.load_module_config_file(SysConstants.API_TREE.value)["api_excel_file_path"]
-    apis_excel_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{apis_excel_file_path}"
-    api_tree_engine.export_api_info_to_excel(apis_excel_file_path, uri, uriSearchMode, http_method, classification, belongs_to_application, channel, swagger_title, api_name)
-    # download the Excel file
-    return send_file(apis_excel_file_path, as_attachment=True)
+    download_name = f"{os.path.splitext(os.path.basename(apis_excel_file_path))[0]}.{export_format}"
+
+    if export_format == 'csv':
+        return Response(api_tree_engine.generate_api_info_csv(*filter_params), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={download_name}'})
+    if export_format == 'ndjson':
+        return Response(api_tree_engine.generate_api_info_ndjson(*filter_params), mimetype='application/x-ndjson',
+                        headers={'Content-Disposition': f'attachment; filename={download_name}'})
+    if export_format != 'xlsx':
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+
+    # export the api info to a temp file for this request only, so the concurrent downloads don't overwrite each other
+    temp_file_descriptor, temp_excel_file_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(temp_file_descriptor)
+    try:
+        api_tree_engine.export_api_info_to_excel(temp_excel_file_path, *filter_params)
+    except Exception:
+        file_tools.delete_file(temp_excel_file_path)
+        raise
+    # stream the Excel file in chunks, it's removed after downloading
+    return Response(file_tools.read_file_in_chunks_and_remove(temp_excel_file_path),
+                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                    headers={'Content-Disposition': f'attachment; filename={download_name}',
+                             'Content-Length': str(os.path.getsize(temp_excel_file_path))})
 
 
 @app.route('/ui_marker/ui_api_relation', methods=['GET'])
@@ -591,6 +753,22 @@ def get_ui_api_relation():
     return jsonify(result), SysConstants.HTTP_STATUS_OK.value
 
 
+@app.route('/ui_marker/ui_api_relations', methods=['POST'])
+def get_ui_api_relations():
+    # get the uri and httpMethod pairs from request body, with format [{"uri": "/cards/{id}", "httpMethod": "GET"}]
+    uri_methods = request.form.get('uriMethods')
+    # if uri_methods is string, parst it to json
+    if isinstance(uri_methods, str):
+        uri_methods = json.loads(uri_methods)
+    # if uri_methods is not an array of uri and httpMethod, return the error message
+    if not isinstance(uri_methods, list) or not all(isinstance(uri_method, dict) and isinstance(uri_method.get("uri"), str)
+                                                    and isinstance(uri_method.get("httpMethod"), str) for uri_method in uri_methods):
+        return jsonify({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.MSG_INVALID_PARAMETERS.value}), SysConstants.HTTP_STATUS_BAD_REQUEST.value
+    # get the ui api relations of all the pairs in 1 call
+    result = ui_marker_engine.get_ui_api_relations(uri_methods)
+    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+
+
 """===========================API Tree related functions end==========================="""
 
 
@@ -646,7 +824,7 @@ def refresh_commit_list():
     thread = threading.Thread(target=refresh_commit_list_thread)
     thread.start()
 
-    return jsonify({"status": SysConstants.STATUS_SUCCESS.value, "result": "refreshing, please wait for about 10 minutes"}), SysConstants.HTTP_STATUS_OK.value
+    return jsonify({"status": SysConstants.STATUS_SUCCESS.value, "result": "refreshing, please check the progress in refresh info"}), SysConstants.HTTP_STATUS_OK.value
 
 
 def refresh_commit_list_thread():
@@ -848,6 +1026,13 @@ def get_os_type():
     result = file_tools.get_os_type()
     return jsonify(result), SysConstants.HTTP_STATUS_OK.value
 
+
+@app.route('/common/uri_cache_info', methods=['GET'])
+def get_uri_cache_info():
+    # get the hit / miss counters of the uri normalize and regex caches
+    result = string_tools.get_uri_cache_info()
+    return jsonify(result), SysConstants.HTTP_STATUS_OK.value
+
 """===========================Common functions end==========================="""
 
 
@@ -0,0 +1,61 @@
+import hashlib
+import os
+import threading
+
+from flask import Response, json
+
+# the etag of the files, with format {normalized_path: (mtime_ns, size, etag)}
+_file_etag_cache = {}
+# the serialized response bodies, with format {cache_key: (etag, body)}
+_response_body_cache = {}
+_etag_cache_lock = threading.Lock()
+
+
+def get_file_etag(file_path):
+    # the etag is the mtime plus the content hash, the hash is only calculated again when the mtime or size changes
+    cache_key = os.path.normcase(os.path.abspath(file_path))
+    try:
+        file_stat = os.stat(file_path)
+    except OSError:
+        return "missing"
+
+    with _etag_cache_lock:
+        cached = _file_etag_cache.get(cache_key)
+        if cached and cached[0] == file_stat.st_mtime_ns and cached[1] == file_stat.st_size:
+            return cached[2]
+
+    content_hash = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            content_hash.update(chunk)
+    etag = f"{file_stat.st_mtime_ns:x}-{content_hash.hexdigest()[:16]}"
+    with _etag_cache_lock:
+        _file_etag_cache[cache_key] = (file_stat.st_mtime_ns, file_stat.st_size, etag)
+    return etag
+
+
+def build_json_response_with_etag(request, cache_key, etag, build_payload):
+    """build the json response for a GET request
+    1. if the client already has this version (If-None-Match), return 304 without body
+    2. otherwise return the serialized body, it's cached by cache_key until the etag changes
+    build_payload is only called when the body of this etag isn't cached yet
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    with _etag_cache_lock:
+        cached = _response_body_cache.get(cache_key)
+    if cached and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = json.dumps(build_payload()).encode('utf-8')
+        with _etag_cache_lock:
+            _response_body_cache[cache_key] = (etag, body)
+
+    response = Response(body, status=200, mimetype='application/json')
+    response.set_etag(etag)
+    # the browser can keep the body, but it has to check the etag with the server every time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
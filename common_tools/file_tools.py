@@ -1,7 +1,10 @@
 import json
 import os
 import shutil
+import stat
 import subprocess
+import tempfile
+import threading
 from lxml import etree
 
 import pandas
@@ -10,6 +13,10 @@ import zipfile
 import common_tools.string_tools as string_tools
 from consts.sys_constants import SysConstants
 
+# the umask of the process, os.umask can only be read by setting it, so it's read once when loading
+_umask = os.umask(0)
+os.umask(_umask)
+
 
 def is_file_exist(file_path):
     return os.path.exists(file_path)
@@ -38,18 +45,55 @@ def load_json(path):
             return {}
 
 
+# in-process cache for parsed json files, with format {normalized_path: (mtime_ns, size, parsed_content)}
+_json_file_cache = {}
+_json_file_cache_lock = threading.Lock()
+
+
+def _get_cache_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def load_cached_json(path):
+    """load a json file once and keep the parsed object in memory, it's reloaded only when the file's mtime or size changes.
+    the returned object is shared between callers, so treat it as read-only"""
+    cache_key = _get_cache_key(path)
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        # the file doesn't exist (any more), drop the stale entry and fall back to load_json
+        invalidate_cached_json(path)
+        return load_json(path)
+
+    with _json_file_cache_lock:
+        cached = _json_file_cache.get(cache_key)
+        if cached and cached[0] == file_stat.st_mtime_ns and cached[1] == file_stat.st_size:
+            return cached[2]
+
+    content = load_json(path)
+    with _json_file_cache_lock:
+        _json_file_cache[cache_key] = (file_stat.st_mtime_ns, file_stat.st_size, content)
+    return content
+
+
+def invalidate_cached_json(path=None):
+    # remove the cached content of the file, or the whole cache if path is None
+    with _json_file_cache_lock:
+        if path is None:
+            _json_file_cache.clear()
+        else:
+            _json_file_cache.pop(_get_cache_key(path), None)
+
+
 def load_module_config(module_name):
-    with open(SysConstants.GLOBAL_CONFIG_FILE.value, encoding="utf8") as f:
-        return json.load(f)[module_name]
+    return load_cached_json(SysConstants.GLOBAL_CONFIG_FILE.value)[module_name]
 
 
 def load_module_config_file(module_name: object) -> object:
-    with open(SysConstants.GLOBAL_CONFIG_FILE.value, encoding="utf8") as f:
-        file_content = f.read()
-        project_base_path = SysConstants.PROJECT_BASE_PATH.value
-        module_conf = json.loads(file_content)[module_name]
-        module_conf_file_path = module_conf['config_file_path']
-        return load_json(f'{project_base_path}/{module_conf_file_path}')
+    project_base_path = SysConstants.PROJECT_BASE_PATH.value
+    module_conf = load_module_config(module_name)
+    module_conf_file_path = module_conf['config_file_path']
+    return load_cached_json(f'{project_base_path}/{module_conf_file_path}')
 
 
 def delete_all_in_folder(folder_path):
@@ -135,6 +179,67 @@ def write_json_to_file(json_data, file_path):
     with open(file_path, 'w', encoding="utf8") as f:
         json.dump(json_data, f, indent=2, ensure_ascii=False)
         print(f"json content has been generated in file {file_path}")
+    # the file has been changed, make sure the next read doesn't get the cached content
+    invalidate_cached_json(file_path)
+
+
+def create_temp_file_for(file_path):
+    """create a hidden temp file in the folder of file_path, it will replace file_path by os.replace, return (fd, temp_file_path)
+    mkstemp creates it with mode 0600, os.replace keeps the mode, so it's changed to the mode of the existing file,
+    or the default mode of a new file if file_path doesn't exist
+    """
+    temp_fd, temp_file_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or None, prefix='.', suffix='.tmp')
+    try:
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask
+    os.chmod(temp_file_path, mode)
+    return temp_fd, temp_file_path
+
+
+def write_json_to_file_atomically(json_data, file_path):
+    # write into a temp file in the same folder first, then replace the target, so readers never see a half-written file
+    temp_fd, temp_file_path = create_temp_file_for(file_path)
+    try:
+        with os.fdopen(temp_fd, 'w', encoding="utf8") as f:
+            json.dump(json_data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+    invalidate_cached_json(file_path)
+    print(f"json content has been generated in file {file_path}")
+
+
+def append_json_lines_to_file(json_objects, file_path):
+    # append each json object as 1 line (NDJSON), the lines are on the disk when it returns
+    lines = ''.join(json.dumps(json_object, ensure_ascii=False) + '\n' for json_object in json_objects)
+    with open(file_path, 'a', encoding="utf8") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_json_lines(file_path, keyword=None):
+    """load the json objects from a NDJSON file, return [] if the file doesn't exist
+    the reading stops at the 1st broken line, it's the half-written tail when the process crashed during appending
+    if keyword is given, only the lines containing it are parsed
+    """
+    json_objects = []
+    if not os.path.exists(file_path):
+        return json_objects
+    with open(file_path, 'r', encoding="utf8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or (keyword is not None and keyword not in line):
+                continue
+            try:
+                json_objects.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Stop reading {file_path} at the broken line {line_number}")
+                break
+    return json_objects
 
 
 
@@ -268,6 +373,19 @@ def write_json_list_to_excel(json_list, file_path, header):
     df.to_excel(file_path, index=False, header=True)
 
 
+def read_file_in_chunks_and_remove(file_path, chunk_size=64 * 1024):
+    # yield the file content chunk by chunk for a streaming response, the file is removed once it's fully read or the response is closed
+    try:
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        delete_file(file_path)
+
+
 def is_windows():
     return os.name == 'nt'
 
@@ -1,25 +1,133 @@
+import hashlib
 import os
 
+import common_tools.file_tools as file_tools
 from consts.sys_constants import SysConstants
 
+# the magic bytes at the beginning of the image file, with format {magic bytes: content type}
+IMAGE_MAGIC_BYTES = {
+    b'\xff\xd8\xff': "image/jpeg",
+    b'\x89PNG\r\n\x1a\n': "image/png"
+}
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+
+def sniff_image_type(image_file):
+    # get the content type from the first bytes of the file, don't trust the one sent by the client
+    header = image_file.stream.read(max(len(magic_bytes) for magic_bytes in IMAGE_MAGIC_BYTES))
+    image_file.stream.seek(0)
+    for magic_bytes, content_type in IMAGE_MAGIC_BYTES.items():
+        if header.startswith(magic_bytes):
+            return content_type
+    return None
+
 
 def verify_image_type(image_file):
-    content_type = image_file.content_type
-    return content_type in ["image/jpeg", "image/png"]
+    return sniff_image_type(image_file) in ["image/jpeg", "image/png"]
+
+
+def get_image_size(image_file):
+    # the size without reading the file into memory, None if the stream can't seek and the client didn't send the length
+    stream = image_file.stream
+    if stream.seekable():
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+        return size
+    return image_file.content_length or None
 
 
 def verify_image_size(image_file):
-    return len(image_file.read()) <= SysConstants.IMAGE_MAX_SIZE.value
+    # the unknown size is checked again when the file is saved, see save_image_in_chunks
+    size = get_image_size(image_file)
+    return size is None or size <= SysConstants.IMAGE_MAX_SIZE.value
 
 
 def verify_image(image_file, verify_empty_flg=True, verify_type_flg=True, verify_size_flg=True):
     if verify_empty_flg and image_file.filename == '':
         return SysConstants.MSG_IMAGE_IS_EMPTY.value
+    if verify_size_flg and not verify_image_size(image_file):
+        return SysConstants.MSG_INVALID_IMAGE_SIZE.value
     if verify_type_flg and not verify_image_type(image_file):
         return SysConstants.MSG_INVALID_IMAGE_TYPE.value
-    if verify_size_flg:
-        image_file.seek(0, os.SEEK_END)  # Move to the end of the file to get its size
-        if not verify_image_size(image_file):
-            return SysConstants.MSG_INVALID_IMAGE_SIZE.value
-        image_file.seek(0)  # Reset file pointer after reading
     return ""
+
+
+def save_image_in_chunks(image_file, file_path, max_size=SysConstants.IMAGE_MAX_SIZE.value):
+    """copy the uploaded file to file_path chunk by chunk, and return the sha256 of the content
+    only 1 chunk is in memory at a time, the file is written into a temp file first, then moved to file_path
+    raise ValueError if the file is larger than max_size
+    """
+    content_hash = hashlib.sha256()
+    size = 0
+    # each call gets its own temp file in the same folder, so 2 uploads of the same page don't write into 1 temp file
+    temp_fd, temp_file_path = file_tools.create_temp_file_for(file_path)
+    stream = image_file.stream
+    if stream.seekable():
+        stream.seek(0)
+    try:
+        with os.fdopen(temp_fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(IMAGE_CHUNK_SIZE), b''):
+                size += len(chunk)
+                if size > max_size:
+                    raise ValueError(SysConstants.MSG_INVALID_IMAGE_SIZE.value)
+                content_hash.update(chunk)
+                f.write(chunk)
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+    return content_hash.hexdigest()
+
+
+def get_file_hash(file_path):
+    # the sha256 of the file, same as the one returned by save_image_in_chunks
+    content_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(IMAGE_CHUNK_SIZE), b''):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def is_image_processing_available():
+    # Pillow is optional, the derivatives are not generated without it
+    try:
+        import PIL
+        return True
+    except ImportError:
+        return False
+
+
+def generate_image_derivative(source_file_path, target_file_path, max_width, max_height, quality):
+    """resize the image to fit in max_width x max_height, keep the aspect ratio, and save it as a compressed jpeg
+    the target is written into a temp file first, so a reader never gets a half-written image
+    return False if Pillow is not installed or the image can't be processed
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        print("Pillow is not installed, the image derivative is not generated")
+        return False
+
+    temp_fd, temp_file_path = file_tools.create_temp_file_for(target_file_path)
+    os.close(temp_fd)
+    try:
+        with Image.open(source_file_path) as image:
+            image.thumbnail((max_width, max_height))
+            # jpeg has no alpha channel, put the transparent screenshot on a white background
+            if image.mode in ("RGBA", "LA", "P"):
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(temp_file_path, format="JPEG", quality=quality, optimize=True, progressive=True)
+        os.replace(temp_file_path, target_file_path)
+        return True
+    except Exception as e:
+        print(f"Failed to generate the image derivative of {source_file_path}: {e}")
+        return False
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
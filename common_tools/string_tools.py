@@ -1,3 +1,4 @@
+import functools
 import random
 import string
 import uuid
@@ -63,28 +64,47 @@ def format_uri(uri):
     return uri
 
 
+# the maximum number of uris kept in the normalize / regex caches
+URI_CACHE_MAX_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=URI_CACHE_MAX_SIZE)
 def normalize_uri(uri):
     uri = format_uri(uri)
     return re.sub(r'\{[^}]*\}', '[^/]*', uri.lower())
 
 
-def create_uri_regex(uri: str) -> re.Pattern:
+@functools.lru_cache(maxsize=URI_CACHE_MAX_SIZE)
+def _compile_uri_regex(uri, full_match_flag, ignore_case_flag):
     # Replace placeholders like {0}, {id}, {cardid}, etc., with a pattern that matches any single segment
-    uri_pattern = normalize_uri(uri)
-    return re.compile(f'^{uri_pattern}', re.IGNORECASE)
+    # the pattern keeps its case when the case is not ignored, so it's part of the cache key
+    uri_pattern = normalize_uri(uri) if ignore_case_flag else re.sub(r'\{[^}]*\}', '[^/]*', format_uri(uri))
+    uri_pattern = f'^{uri_pattern}$' if full_match_flag else f'^{uri_pattern}'
+    return re.compile(uri_pattern, re.IGNORECASE if ignore_case_flag else 0)
+
+
+def create_uri_regex(uri: str, ignore_case_flag: bool = True) -> re.Pattern:
+    return _compile_uri_regex(uri, False, ignore_case_flag)
+
+
+def create_uri_full_match_regex(uri: str, ignore_case_flag: bool = True) -> re.Pattern:
+    return _compile_uri_regex(uri, True, ignore_case_flag)
 
 
-def create_uri_full_match_regex(uri: str) -> re.Pattern:
-    # Replace placeholders like {0} with a pattern that matches any single segment
-    uri_pattern = normalize_uri(uri)
-    return re.compile(f'^{uri_pattern}$', re.IGNORECASE)
+def get_uri_cache_info():
+    # the hit / miss counters of the uri caches, both caches are thread-safe
+    cache_info = {}
+    for cache_name, cached_function in [("normalize_uri", normalize_uri), ("uri_regex", _compile_uri_regex)]:
+        info = cached_function.cache_info()
+        cache_info[cache_name] = {"hits": info.hits, "misses": info.misses, "maxSize": info.maxsize, "currentSize": info.currsize}
+    return cache_info
 
 
 def partial_match_uri_with_variables(search_uri: str, compared_uri: str, ignore_case_flag: bool = True) -> bool:
-    regex = create_uri_regex(search_uri)
-    return regex.match(compared_uri.lower() if ignore_case_flag else compared_uri) is not None
+    regex = create_uri_regex(search_uri, ignore_case_flag)
+    return regex.match(compared_uri) is not None
 
 
 def exact_match_uri_with_variables(search_uri: str, compared_uri: str, ignore_case_flag: bool = True) -> bool:
-    regex = create_uri_full_match_regex(search_uri)
-    return regex.match(compared_uri.lower() if ignore_case_flag else compared_uri) is not None
+    regex = create_uri_full_match_regex(search_uri, ignore_case_flag)
+    return regex.match(compared_uri) is not None
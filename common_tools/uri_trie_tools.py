@@ -0,0 +1,155 @@
+"""
+a segment based route trie for URIs with variables, such as /cards/{cardId}/transactions
+1. the URI is formatted by string_tools.format_uri and lower-cased, then split by '/' into segments
+2. any {xxx} placeholder in a segment is stored as {}, so /cards/{id} and /cards/{cardId} share the same node
+3. each node keeps the APIs ending at it, with format {http_method: set(api_id)}
+the node is a dict with format as below
+{
+    "children": {segment: node},
+    "pattern_children": {segment: compiled regex of the segment},   // only the segments with placeholders
+    "entries": {http_method: set(api_id)}
+}
+"""
+import re
+
+from common_tools import string_tools
+
+_PLACEHOLDER_PATTERN = re.compile(r'\{[^}]*\}')
+_NORMALIZED_PLACEHOLDER = '{}'
+
+
+def create_trie():
+    return {"children": {}, "pattern_children": {}, "entries": {}}
+
+
+def split_uri_segments(uri):
+    # '' and '/' are formatted as '', which has no segment
+    uri = string_tools.format_uri(uri or '').lower()
+    return [_PLACEHOLDER_PATTERN.sub(_NORMALIZED_PLACEHOLDER, segment) for segment in uri.split('/')[1:]] if uri else []
+
+
+def _create_segment_regex(segment, full_match=True):
+    # the placeholder matches any characters in 1 segment, same as string_tools.normalize_uri
+    pattern = '[^/]*'.join(re.escape(part) for part in segment.split(_NORMALIZED_PLACEHOLDER))
+    return re.compile(f'^{pattern}$' if full_match else f'^{pattern}')
+
+
+def insert(trie, uri, http_method, api_id):
+    node = trie
+    for segment in split_uri_segments(uri):
+        child = node["children"].get(segment)
+        if child is None:
+            child = create_trie()
+            node["children"][segment] = child
+            if _NORMALIZED_PLACEHOLDER in segment:
+                node["pattern_children"][segment] = _create_segment_regex(segment)
+        node = child
+    node["entries"].setdefault(http_method, set()).add(api_id)
+
+
+def remove(trie, uri, http_method, api_id):
+    # remove the api_id, and prune the nodes which have no entries and no children any more
+    path = []
+    node = trie
+    for segment in split_uri_segments(uri):
+        child = node["children"].get(segment)
+        if child is None:
+            return
+        path.append((node, segment))
+        node = child
+    api_ids = node["entries"].get(http_method)
+    if not api_ids:
+        return
+    api_ids.discard(api_id)
+    if not api_ids:
+        del node["entries"][http_method]
+    for parent, segment in reversed(path):
+        child = parent["children"][segment]
+        if child["entries"] or child["children"]:
+            break
+        del parent["children"][segment]
+        parent["pattern_children"].pop(segment, None)
+
+
+def _collect_entries(nodes, http_method):
+    api_ids = set()
+    for node in nodes:
+        if http_method is None:
+            for method_api_ids in node["entries"].values():
+                api_ids.update(method_api_ids)
+        else:
+            api_ids.update(node["entries"].get(http_method, ()))
+    return api_ids
+
+
+def _collect_subtree(node):
+    nodes = []
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        nodes.append(current)
+        pending.extend(current["children"].values())
+    return nodes
+
+
+def _walk_by_template(trie, segments, last_segment_as_prefix=False):
+    # the placeholder in the template matches any stored segment, the literal matches the same stored segment only
+    nodes = [trie]
+    for index, segment in enumerate(segments):
+        is_prefix = last_segment_as_prefix and index == len(segments) - 1
+        next_nodes = []
+        if _NORMALIZED_PLACEHOLDER in segment or is_prefix:
+            regex = _create_segment_regex(segment, full_match=not is_prefix)
+            for node in nodes:
+                next_nodes.extend(child for key, child in node["children"].items() if regex.match(key))
+        else:
+            for node in nodes:
+                child = node["children"].get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+        if not next_nodes:
+            return []
+        nodes = next_nodes
+    return nodes
+
+
+def find_exact(trie, uri, http_method=None):
+    # the stored URIs which are the same as uri after normalizing, such as /cards/{id} and /Cards/{cardId}
+    node = trie
+    for segment in split_uri_segments(uri):
+        node = node["children"].get(segment)
+        if node is None:
+            return {}
+    if http_method is None:
+        return {method: set(api_ids) for method, api_ids in node["entries"].items()}
+    return {http_method: set(node["entries"][http_method])} if http_method in node["entries"] else {}
+
+
+def find_matched_by_template(trie, template_uri, http_method=None):
+    # the stored URIs fully matched by template_uri, same as string_tools.exact_match_uri_with_variables
+    return _collect_entries(_walk_by_template(trie, split_uri_segments(template_uri)), http_method)
+
+
+def find_matched_by_prefix(trie, template_uri, http_method=None):
+    # the stored URIs starting with template_uri, same as string_tools.partial_match_uri_with_variables
+    nodes = []
+    for node in _walk_by_template(trie, split_uri_segments(template_uri), last_segment_as_prefix=True):
+        nodes.extend(_collect_subtree(node))
+    return _collect_entries(nodes, http_method)
+
+
+def find_templates_matching_uri(trie, concrete_uri, http_method=None):
+    # the stored templates which match a concrete URI, such as /cards/{id} for /cards/123
+    nodes = [trie]
+    for segment in split_uri_segments(concrete_uri):
+        next_nodes = []
+        for node in nodes:
+            child = node["children"].get(segment)
+            if child is not None:
+                next_nodes.append(child)
+            next_nodes.extend(node["children"][key] for key, regex in node["pattern_children"].items()
+                              if key != segment and regex.match(segment))
+        if not next_nodes:
+            return set()
+        nodes = next_nodes
+    return _collect_entries(nodes, http_method)
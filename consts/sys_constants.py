@@ -27,6 +27,9 @@ class SysConstants(Enum):
         MSG_IMAGE_IS_EMPTY = "Image file is empty"
         MSG_INVALID_PARAMETERS = "Invalid parameters, application / module / function is empty"
         IMAGE_MAX_SIZE = 5242880 # 5M
+        # the resized copies of the page image, with format {size: (max width, max height, jpeg quality)}
+        IMAGE_DERIVATIVE_SIZES = {"thumbnail": (320, 320, 70), "preview": (1280, 1280, 80)}
+        IMAGE_SIZE_ORIGINAL = "original"
 
         # Message related to xsd converter
         MSG_XSD_IS_EMPTY = "XSD file is empty"
@@ -40,10 +43,19 @@ class SysConstants(Enum):
 
         # Message related to API Tree
         API_ALREADY_EXISTS = "The API [{0}] with method [{1}] already exists"
+        API_DUPLICATED_IN_BATCH = "The API [{0}] with method [{1}] is duplicated in the same batch"
+        API_URI_OR_METHOD_IS_EMPTY = "Invalid API, uri / httpMethod is empty"
+        API_URI_OR_METHOD_IS_INVALID = "Invalid API, uri [{0}] / httpMethod [{1}] is not valid"
+        API_HTTP_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS", "TRACE"]
+        # the api tree view stops at this depth, the deeper sub apis are not expanded
+        API_TREE_VIEW_MAX_DEPTH = 10
         API_TYPE_OPEN = "Open"
         API_TYPE_PRIVATE = "Private"
         API_TYPE_PARTNER = "Partner"
         API_URI_SEARCH_MODE_EXACT = "Exact Match"
+        API_SEARCH_DEFAULT_PAGE_SIZE = 50
+        API_SEARCH_MAX_PAGE_SIZE = 1000
+        API_SEARCH_SORTABLE_FIELDS = ["createTime", "uri", "httpMethod", "classification", "belongsToApplication", "channel", "swaggerTitle", "apiName"]
 
         # HTTP Status Code
         HTTP_STATUS_OK = 200
@@ -56,7 +68,10 @@ class SysConstants(Enum):
         UI_MARKER_PAGE_PREFIX = "page_"
         UI_MARKER_ELEMENT_PREFIX = "element_"
         UI_MARKER_FORM_PREFIX = "form_"
+        UI_MARKER_BUNDLE_PREFIX = "bundle_"
         UI_MARKER_UI_API_RELATION_FILE = "ui_api_relation_data.json"
+        UI_MARKER_UI_API_RELATION_MANIFEST_FILE = "ui_api_relation_manifest.json"
+        UI_MARKER_PAGE_SUMMARIES_FILE = ".page_summaries.json"
 
         # One step
         ONE_STEP_EXC_WS_OUTPUT = "one_step_exc_ws_output"
@@ -2,11 +2,15 @@ from common_tools import file_tools
 from consts.sys_constants import SysConstants
 
 
-def get_abbreviations():
-    # get the json object from file /conf/contacts_config.json
+def get_data_file_path():
+    # get the json object from file /conf/abbreviation_config.json
     abbreviation_conf = file_tools.load_module_config_file(SysConstants.ABBREVIATION.value)
-    # get location file path from the json object, from field 'location_file_path'
-    data_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{abbreviation_conf['data_file_path']}"
+    # get the data file path from the json object, from field 'data_file_path'
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{abbreviation_conf['data_file_path']}"
+
+
+def get_abbreviations():
+    data_file_path = get_data_file_path()
     # get the array from file location_file_path
     abbreviations = file_tools.load_json(data_file_path)
     # if not locations, return empty list
@@ -16,9 +20,6 @@ def get_abbreviations():
 
 
 def update_abbreviations(abbreviations):
-    # get the json object from file /conf/contacts_config.json
-    abbreviation_conf = file_tools.load_module_config_file(SysConstants.ABBREVIATION.value)
-    # get team file path from the json object, from field 'team_file_path'
-    data_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{abbreviation_conf['data_file_path']}"
+    data_file_path = get_data_file_path()
     # write the array to file team_file_path
     file_tools.write_json_to_file(abbreviations, data_file_path)
\ No newline at end of file
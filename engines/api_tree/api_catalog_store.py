@@ -0,0 +1,408 @@
+"""
+the resident API catalog for api_tree_engine
+1. apis.json is loaded once into a dict keyed by the API id, and reloaded only when the file is changed by someone else
+2. all the reads and writes go through catalog_lock, so they don't race with each other
+3. the changes are saved by the storage_mode in api_tree_config.json
+   snapshot: the write-behind timer writes the whole apis.json, several changes in a short period end up in 1 atomic file write
+   journal: each change is appended to the journal file (NDJSON) before it's applied, with the time and the operator,
+            the compaction folds the journal into apis.json periodically, and moves the journal lines into the history file,
+            the history file is rotated by size, only the last apis_history_max_rotated_files files are kept
+            on loading, the journal is replayed over apis.json
+"""
+import atexit
+import logging
+import os
+import threading
+import uuid
+
+from common_tools import file_tools, string_tools, uri_trie_tools
+from consts.sys_constants import SysConstants
+
+log = logging.getLogger(__name__)
+
+# hold this lock to make several reads / writes as one transaction, it's reentrant
+catalog_lock = threading.RLock()
+
+_catalog = {
+    "apis": None,           # {api_id: api}, keep the same order as in apis.json
+    "uri_trie": None,       # the route trie of all the APIs, see uri_trie_tools
+    "field_indexes": None,  # the inverted indexes of INDEXED_FIELDS
+    "parent_ids": None,     # the reverse index of subIds, with format {sub_api_id: set(parent_api_id)}
+    "file_path": None,
+    "file_stat": None,      # (mtime_ns, size) of apis.json (and the journal) when it's loaded or written by the catalog
+    "dirty": False,         # snapshot: there're changes not written yet; journal: there're changes not compacted yet
+    "journal_size": 0,      # the number of the changes in the journal
+    "version": 0            # increased on every change, can be used to invalidate the derived data
+}
+_flush_timer = {"timer": None}
+# the version is restarted from 0 in a new process, so the etag needs a per process token
+_process_token = uuid.uuid4().hex[:8]
+
+# the fields which have an inverted index, with format {field: {lower-cased value: set(api_id)}}
+INDEXED_FIELDS = ['httpMethod', 'classification', 'belongsToApplication', 'channel', 'swaggerTitle', 'apiName']
+
+STORAGE_MODE_SNAPSHOT = 'snapshot'
+STORAGE_MODE_JOURNAL = 'journal'
+
+
+def get_apis_file_path():
+    # get the api_tree module config
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    # get the apis_file_path
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{api_tree_conf['apis_file_path']}"
+
+
+def get_journal_file_path():
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{api_tree_conf.get('apis_journal_file_path', '/static/api_tree/apis_journal.ndjson')}"
+
+
+def get_history_file_path():
+    # the compacted journal lines are kept in this file as the change history, empty means not to keep them
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    history_file_path = api_tree_conf.get('apis_history_file_path', '/static/api_tree/apis_history.ndjson')
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{history_file_path}" if history_file_path else None
+
+
+def get_history_file_paths():
+    # the history files with the oldest first, the rotated ones are history_file_path.1 (newest) to history_file_path.N (oldest)
+    history_file_path = get_history_file_path()
+    if not history_file_path:
+        return []
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    max_rotated_files = api_tree_conf.get('apis_history_max_rotated_files', 3)
+    return [f"{history_file_path}.{index}" for index in range(max_rotated_files, 0, -1)] + [history_file_path]
+
+
+def _rotate_history(history_file_path):
+    # when the history file is larger than apis_history_max_size_in_mb, shift it to .1, and drop the oldest one
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    max_size = api_tree_conf.get('apis_history_max_size_in_mb', 10) * 1024 * 1024
+    if not os.path.exists(history_file_path) or os.path.getsize(history_file_path) < max_size:
+        return
+    max_rotated_files = api_tree_conf.get('apis_history_max_rotated_files', 3)
+    if max_rotated_files <= 0:
+        os.remove(history_file_path)
+        return
+    for index in range(max_rotated_files, 1, -1):
+        if os.path.exists(f"{history_file_path}.{index - 1}"):
+            os.replace(f"{history_file_path}.{index - 1}", f"{history_file_path}.{index}")
+    os.replace(history_file_path, f"{history_file_path}.1")
+    log.info(f"Rotated the API change history file {history_file_path}")
+
+
+def is_journal_mode():
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    return api_tree_conf.get('storage_mode', STORAGE_MODE_SNAPSHOT) == STORAGE_MODE_JOURNAL
+
+
+def _get_file_stat(file_path):
+    try:
+        file_stat = os.stat(file_path)
+        return file_stat.st_mtime_ns, file_stat.st_size
+    except OSError:
+        return None
+
+
+def _get_storage_stat(file_path):
+    # in journal mode, the catalog is changed if either apis.json or the journal is changed
+    if is_journal_mode():
+        return _get_file_stat(file_path), _get_file_stat(get_journal_file_path())
+    return _get_file_stat(file_path)
+
+
+def _ensure_loaded():
+    file_path = get_apis_file_path()
+    # there're pending changes in memory, the memory is the latest one
+    if _catalog["apis"] is not None and _catalog["dirty"] and _catalog["file_path"] == file_path and not is_journal_mode():
+        return
+    file_stat = _get_storage_stat(file_path)
+    if _catalog["apis"] is not None and _catalog["file_path"] == file_path and _catalog["file_stat"] == file_stat:
+        return
+
+    # first load, or the file is changed outside of the catalog
+    apis = file_tools.load_json(file_path)
+    _catalog["apis"] = {api["id"]: api for api in apis} if apis else {}
+    _catalog["file_path"] = file_path
+    _catalog["file_stat"] = file_stat
+    _catalog["journal_size"] = 0
+    _catalog["dirty"] = False
+    if is_journal_mode():
+        _replay_journal()
+    _rebuild_indexes()
+    _catalog["version"] += 1
+    log.info(f"API catalog loaded from {file_path} with {len(_catalog['apis'])} APIs")
+    if _catalog["journal_size"]:
+        # fold the replayed changes into apis.json before any new change is appended after a broken tail of the journal
+        _catalog["dirty"] = True
+        try:
+            _compact()
+        except Exception as e:
+            log.error(f"Failed to compact the API catalog journal: {e}")
+            _schedule_flush()
+
+
+def _replay_journal():
+    # apply the changes in the journal over apis.json, the indexes are rebuilt after it
+    changes = file_tools.load_json_lines(get_journal_file_path())
+    for change in changes:
+        _apply_change(change, indexed=False)
+    _catalog["journal_size"] = len(changes)
+    if changes:
+        log.info(f"Replayed {len(changes)} changes from the API catalog journal")
+
+
+def _apply_change(change, indexed=True):
+    """apply 1 change to the catalog, the change is the same as the journal line, with format as below
+    {"op": "put", "api": {...}}
+    {"op": "update", "id": "...", "fields": {...}}
+    {"op": "delete", "id": "..."}
+    all of them are idempotent, so replaying the journal over a apis.json which has already included it is fine
+    """
+    apis = _catalog["apis"]
+    op = change["op"]
+    api_id = change["api"]["id"] if op == "put" else change["id"]
+    existing_api = apis.get(api_id)
+    if existing_api is not None and indexed:
+        _unindex_api(existing_api)
+    if op == "put":
+        apis[api_id] = change["api"]
+    elif op == "update" and existing_api is not None:
+        apis[api_id] = {**existing_api, **change["fields"]}
+    elif op == "delete":
+        apis.pop(api_id, None)
+    if api_id in apis and indexed:
+        _index_api(apis[api_id])
+
+
+def _save_changes(changes, operator=None):
+    # journal mode: append the changes to the journal before they're applied, so a change is never lost once it returns
+    if is_journal_mode():
+        change_time = string_tools.generate_create_time()
+        file_tools.append_json_lines_to_file([{"time": change_time, "operator": operator, **change} for change in changes],
+                                             get_journal_file_path())
+        _catalog["journal_size"] += len(changes)
+    for change in changes:
+        _apply_change(change)
+    if is_journal_mode():
+        # the journal is written by the catalog itself, it's not an outside change
+        _catalog["file_stat"] = _get_storage_stat(_catalog["file_path"])
+    _mark_dirty()
+
+
+def _rebuild_indexes():
+    _catalog["uri_trie"] = uri_trie_tools.create_trie()
+    _catalog["field_indexes"] = {field: {} for field in INDEXED_FIELDS}
+    _catalog["parent_ids"] = {}
+    for api in _catalog["apis"].values():
+        _index_api(api)
+
+
+def _index_api(api):
+    if api.get("uri") and api.get("httpMethod"):
+        uri_trie_tools.insert(_catalog["uri_trie"], api["uri"], api["httpMethod"], api["id"])
+    for field in INDEXED_FIELDS:
+        value = str(api.get(field) or '').lower()
+        _catalog["field_indexes"][field].setdefault(value, set()).add(api["id"])
+    for sub_id in api.get("subIds") or []:
+        _catalog["parent_ids"].setdefault(sub_id, set()).add(api["id"])
+
+
+def _unindex_api(api):
+    if api.get("uri") and api.get("httpMethod"):
+        uri_trie_tools.remove(_catalog["uri_trie"], api["uri"], api["httpMethod"], api["id"])
+    for field in INDEXED_FIELDS:
+        value = str(api.get(field) or '').lower()
+        field_index = _catalog["field_indexes"][field]
+        api_ids = field_index.get(value)
+        if api_ids is not None:
+            api_ids.discard(api["id"])
+            if not api_ids:
+                del field_index[value]
+    for sub_id in api.get("subIds") or []:
+        parent_ids = _catalog["parent_ids"].get(sub_id)
+        if parent_ids is not None:
+            parent_ids.discard(api["id"])
+            if not parent_ids:
+                del _catalog["parent_ids"][sub_id]
+
+
+def _mark_dirty():
+    _catalog["dirty"] = True
+    _catalog["version"] += 1
+    _schedule_flush()
+
+
+def _schedule_flush():
+    api_tree_conf = file_tools.load_module_config_file(SysConstants.API_TREE.value)
+    if is_journal_mode():
+        # the changes are safe in the journal already, compact it periodically, or at once if it's too long
+        if _catalog["journal_size"] >= api_tree_conf.get("journal_compaction_threshold", 1000):
+            delay = 0
+            if _flush_timer["timer"] is not None and _flush_timer["timer"].interval > 0:
+                _flush_timer["timer"].cancel()
+                _flush_timer["timer"] = None
+        else:
+            delay = api_tree_conf.get("journal_compaction_interval_in_seconds", 300)
+    else:
+        delay = api_tree_conf.get("write_behind_delay_in_seconds", 1)
+    # only 1 pending timer at a time, all the changes before it fires are flushed together
+    if _flush_timer["timer"] is not None:
+        return
+    timer = threading.Timer(delay, flush)
+    timer.daemon = True
+    _flush_timer["timer"] = timer
+    timer.start()
+
+
+def flush():
+    # write all the pending changes into apis.json, in journal mode it's the compaction
+    with catalog_lock:
+        _flush_timer["timer"] = None
+        if not _catalog["dirty"]:
+            return
+        try:
+            if is_journal_mode():
+                _compact()
+            else:
+                file_tools.write_json_to_file_atomically(list(_catalog["apis"].values()), _catalog["file_path"])
+                _catalog["file_stat"] = _get_file_stat(_catalog["file_path"])
+                _catalog["dirty"] = False
+        except Exception as e:
+            log.error(f"Failed to flush the API catalog into {_catalog['file_path']}: {e}")
+            # keep the changes in memory and try again later
+            _schedule_flush()
+
+
+def _compact():
+    """fold the journal into apis.json
+    1. write the whole catalog into apis.json atomically
+    2. move the journal lines into the history file, and empty the journal
+    if the process crashes between 1 and 2, the journal is replayed again on the next loading, it's idempotent
+    """
+    journal_file_path = get_journal_file_path()
+    file_tools.write_json_to_file_atomically(list(_catalog["apis"].values()), _catalog["file_path"])
+    history_file_path = get_history_file_path()
+    if history_file_path:
+        changes = file_tools.load_json_lines(journal_file_path)
+        if changes:
+            file_tools.append_json_lines_to_file(changes, history_file_path)
+            _rotate_history(history_file_path)
+    if os.path.exists(journal_file_path):
+        with open(journal_file_path, 'w', encoding="utf8") as f:
+            os.fsync(f.fileno())
+    log.info(f"Compacted {_catalog['journal_size']} changes of the API catalog journal into {_catalog['file_path']}")
+    _catalog["journal_size"] = 0
+    _catalog["file_stat"] = _get_storage_stat(_catalog["file_path"])
+    _catalog["dirty"] = False
+
+
+def get_version():
+    with catalog_lock:
+        _ensure_loaded()
+        return _catalog["version"]
+
+
+def get_etag():
+    # changed on every change of the catalog
+    return f"{_process_token}-{get_version()}"
+
+
+def get_uri_trie():
+    # hold catalog_lock while using the trie, it's changed together with the catalog
+    with catalog_lock:
+        _ensure_loaded()
+        return _catalog["uri_trie"]
+
+
+def find_api_ids_by_field(field, keyword):
+    # the APIs whose field value contains keyword ignore case, only the distinct values are scanned
+    keyword = keyword.lower()
+    with catalog_lock:
+        _ensure_loaded()
+        api_ids = set()
+        for value, value_api_ids in _catalog["field_indexes"][field].items():
+            if keyword in value:
+                api_ids.update(value_api_ids)
+        return api_ids
+
+
+def get_parent_ids(api_id):
+    # the ids of the APIs which have api_id in their subIds
+    with catalog_lock:
+        _ensure_loaded()
+        return set(_catalog["parent_ids"].get(api_id, ()))
+
+
+def get_apis_by_ids(api_ids):
+    # get the APIs by ids, keep the order in the catalog
+    with catalog_lock:
+        _ensure_loaded()
+        api_ids = set(api_ids)
+        return [api for api_id, api in _catalog["apis"].items() if api_id in api_ids]
+
+
+def get_all_apis():
+    # the records are shared with the catalog, don't change them directly, use the functions below instead
+    with catalog_lock:
+        _ensure_loaded()
+        return list(_catalog["apis"].values())
+
+
+def get_api(api_id):
+    with catalog_lock:
+        _ensure_loaded()
+        return _catalog["apis"].get(api_id)
+
+
+def get_change_history(api_id):
+    """the changes of an API in the history file and the journal, with format as below, the oldest first
+    {"time": "2024-01-01 10:00:00 000000", "operator": "10.0.0.1", "op": "put", "api": {...}}
+    only the lines containing api_id are parsed, the history files are bounded by the rotation
+    """
+    with catalog_lock:
+        changes = []
+        for history_file_path in get_history_file_paths() + [get_journal_file_path()]:
+            changes.extend(file_tools.load_json_lines(history_file_path, api_id))
+    return [change for change in changes
+            if (change["api"]["id"] if change["op"] == "put" else change.get("id")) == api_id]
+
+
+def put_api(api, operator=None):
+    # add a new API or replace the existing one with the same id
+    with catalog_lock:
+        _ensure_loaded()
+        _save_changes([{"op": "put", "api": api}], operator)
+
+
+def put_apis(apis, operator=None):
+    # add or replace several APIs in 1 transaction, they're written to the file together
+    if not apis:
+        return
+    with catalog_lock:
+        _ensure_loaded()
+        _save_changes([{"op": "put", "api": api} for api in apis], operator)
+
+
+def update_api_fields(api_id, fields, operator=None):
+    # update some fields of an API, return False if the API doesn't exist
+    with catalog_lock:
+        _ensure_loaded()
+        if api_id not in _catalog["apis"]:
+            return False
+        _save_changes([{"op": "update", "id": api_id, "fields": fields}], operator)
+        return True
+
+
+def remove_api(api_id, operator=None):
+    # remove an API, return the removed one or None
+    with catalog_lock:
+        _ensure_loaded()
+        api = _catalog["apis"].get(api_id)
+        if api is not None:
+            _save_changes([{"op": "delete", "id": api_id}], operator)
+        return api
+
+
+# don't lose the pending changes when the process exits normally
+atexit.register(flush)
@@ -1,10 +1,14 @@
+import base64
+import csv
+import io
 import json
-import pandas as pd
 import logging
-from collections import defaultdict
+import threading
 
-from common_tools import file_tools, string_tools
-from werkzeug.utils import secure_filename
+import xlsxwriter
+
+from common_tools import string_tools, uri_trie_tools
+from engines.api_tree import api_catalog_store
 from consts.sys_constants import SysConstants
 
 # Logger setup
@@ -14,6 +18,10 @@ logging.basicConfig(level=logging.INFO, handlers=[
 ])
 log = logging.getLogger(__name__)
 
+# the parent / child structure of the apis, rebuilt when the catalog version changes
+_api_tree_cache = {"version": None, "tree": None}
+_api_tree_cache_lock = threading.Lock()
+
 
 def get_open_apis():
     # get all apis
@@ -32,227 +40,423 @@ def get_private_apis():
 
 
 def get_apis():
-    # get the api_tree module config
-    api_tree_conf = file_tools.load_module_config_file("api_tree")
-    # get the apis_file_path for update
-    apis_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{api_tree_conf['apis_file_path']}"
-    # get the json from apis_file_path, it's an array
-    apis = file_tools.load_json(apis_file_path)
-    # if not apis, return empty list
-    if not apis:
-        return []
-    return apis
-
-
-def add_open_apis(api_entities):
-    # loop the api_entities, and add each api_entity by calling add_api
-    for api_entity in api_entities:
-        add_api(api_entity)
-
-
-def add_api(api_entity):
-    # get all open APIs
-    apis = get_apis()
+    # get all the apis from the resident catalog, it's loaded from apis_file_path only once
+    return api_catalog_store.get_all_apis()
+
+
+def add_open_apis(api_entities, operator=None):
+    """add the api_entities in 1 batch
+    1. validate all the api_entities in 1 pass, against the catalog and against the previous ones in the same batch
+    2. add all the accepted api_entities in 1 transaction
+    3. return the result of each api_entity with format as below, operator is recorded in the journal of the catalog
+    the httpMethod is upper-cased, so "get" and "GET" are the same api
+    the top level status is success if any api_entity is added, and failed only if nothing is added
+    {
+        "index": 0,
+        "uri": "/cards/{cardId}",
+        "httpMethod": "GET",
+        "status": "success",    // success or failed
+        "id": "63a7e058-fbbb-49d3-9d16-56370a2ad13e",     // only for the added one
+        "message": ""           // only for the failed one
+    }
+    """
+    results = []
+    accepted_apis = []
+    # the route trie of the accepted ones in this batch, to find the duplicates inside the batch
+    batch_uri_trie = uri_trie_tools.create_trie()
+
+    with api_catalog_store.catalog_lock:
+        uri_trie = api_catalog_store.get_uri_trie()
+        for index, api_entity in enumerate(api_entities):
+            uri = api_entity.get("uri") if isinstance(api_entity, dict) else None
+            http_method = api_entity.get("httpMethod") if isinstance(api_entity, dict) else None
+            result = {"index": index, "uri": uri, "httpMethod": http_method}
+            results.append(result)
+
+            if not uri or not http_method:
+                result.update({"status": SysConstants.STATUS_FAILED.value, "message": SysConstants.API_URI_OR_METHOD_IS_EMPTY.value})
+                continue
+            if not isinstance(uri, str) or not isinstance(http_method, str) or http_method.upper() not in SysConstants.API_HTTP_METHODS.value:
+                result.update({"status": SysConstants.STATUS_FAILED.value,
+                               "message": string_tools.format_message(SysConstants.API_URI_OR_METHOD_IS_INVALID.value, uri, http_method)})
+                continue
+            http_method = http_method.upper()
+            api_entity["httpMethod"] = http_method
+            result["httpMethod"] = http_method
+            if uri_trie_tools.find_matched_by_template(uri_trie, uri, http_method):
+                result.update({"status": SysConstants.STATUS_FAILED.value,
+                               "message": string_tools.format_message(SysConstants.API_ALREADY_EXISTS.value, uri, http_method)})
+                continue
+            if uri_trie_tools.find_matched_by_template(batch_uri_trie, uri, http_method):
+                result.update({"status": SysConstants.STATUS_FAILED.value,
+                               "message": string_tools.format_message(SysConstants.API_DUPLICATED_IN_BATCH.value, uri, http_method)})
+                continue
+
+            api_entity["id"] = string_tools.generate_uuid()
+            api_entity["createTime"] = string_tools.generate_create_time()
+            uri_trie_tools.insert(batch_uri_trie, uri, http_method, api_entity["id"])
+            accepted_apis.append(api_entity)
+            result.update({"status": SysConstants.STATUS_SUCCESS.value, "id": api_entity["id"]})
+
+        # add all the accepted ones together, they will be saved to apis_file_path in 1 write
+        api_catalog_store.put_apis(accepted_apis, operator)
+
+    failed_count = len(results) - len(accepted_apis)
+    log.info(f"Imported {len(accepted_apis)} APIs, {failed_count} APIs are rejected")
+    return {"status": SysConstants.STATUS_SUCCESS.value if accepted_apis or not results else SysConstants.STATUS_FAILED.value,
+            "successCount": len(accepted_apis),
+            "failedCount": failed_count,
+            "results": results}
+
+
+def add_api(api_entity, operator=None):
+    # check and add in 1 transaction, so 2 requests can't add the same API at the same time
+    with api_catalog_store.catalog_lock:
+        # check if the api_entity is already in the apis identified by its uri and httpMethod
+        uri_trie = api_catalog_store.get_uri_trie()
+        is_exist = bool(uri_trie_tools.find_matched_by_template(uri_trie, api_entity["uri"], api_entity["httpMethod"]))
+        # if the api_entity is already in the apis, return error message
+        if is_exist:
+            formatted_message = string_tools.format_message(SysConstants.API_ALREADY_EXISTS.value,
+                                                            api_entity["uri"],
+                                                            api_entity["httpMethod"])
+            return {"status": SysConstants.STATUS_FAILED.value, "message": formatted_message}
+
+        api_entity["id"] = string_tools.generate_uuid()
+        api_entity["createTime"] = string_tools.generate_create_time()
+        # add the api_entity to the catalog, it will be saved to apis_file_path by the catalog
+        api_catalog_store.put_api(api_entity, operator)
+    return {"status": SysConstants.STATUS_SUCCESS.value}
 
-    # check if the api_entity is already in the apis identified by its uri and httpMethod
-    is_exist = False
 
-    for api in apis:
-        if ((string_tools.exact_match_uri_with_variables(api_entity["uri"], api["uri"])) and
-                (api["httpMethod"] == api_entity["httpMethod"])):
-            is_exist = True
-            break
-    # if the api_entity is already in the apis, return error message
-    if is_exist:
-        formatted_message = string_tools.format_message(SysConstants.API_ALREADY_EXISTS.value,
-                                                        api_entity["uri"],
-                                                        api_entity["httpMethod"])
-        return {"status": SysConstants.STATUS_FAILED.value, "message": formatted_message}
-
-    api_entity["id"] = string_tools.generate_uuid()
-    api_entity["createTime"] = string_tools.generate_create_time()
-    # add the api_entity to the apis
-    apis.append(api_entity)
-    # save the apis to the apis_file_path
-    return save_apis_to_file(apis)
-
-
-def delete_api(api_id):
-    # get all open APIs
-    apis = get_apis()
-    # filter the api by api_id
-    apis = [api for api in apis if api["id"] != api_id]
-    # if it's in the subIds, remove it from the subIds
-    for api in apis:
-        if api_id in api["subIds"]:
-            api["subIds"].remove(api_id)
-    # save the apis to the apis_file_path
-    return save_apis_to_file(apis)
+def delete_api(api_id, operator=None):
+    with api_catalog_store.catalog_lock:
+        # remove the api by api_id
+        api_catalog_store.remove_api(api_id, operator)
+        # if it's in the subIds, remove it from the subIds, only the parents in the reverse index are touched
+        for parent_id in api_catalog_store.get_parent_ids(api_id):
+            parent_api = api_catalog_store.get_api(parent_id)
+            api_catalog_store.update_api_fields(parent_id, {"subIds": [sub_id for sub_id in parent_api["subIds"] if sub_id != api_id]},
+                                                operator)
+    return {"status": SysConstants.STATUS_SUCCESS.value}
 
 
-def update_api(api_entity):
-    # get all open APIs
-    apis = get_apis()
-    # filter the api by api_id
-    apis = [api for api in apis if api["id"] != api_entity["id"]]
-
-    # add the api_entity to the apis
-    apis.append(api_entity)
-    # save the apis to the apis_file_path
-    return save_apis_to_file(apis)
+def update_api(api_entity, operator=None):
+    # replace the api which has the same id with api_entity
+    api_catalog_store.put_api(api_entity, operator)
+    return {"status": SysConstants.STATUS_SUCCESS.value}
 
 
-def update_sub_apis(id, subIds):
-    # get all open APIs
-    apis = get_apis()
+def update_sub_apis(id, subIds, operator=None):
     # convert subIds to array
     subIds = json.loads(subIds)
-    # filter the api by api_id
-    for api in apis:
-        if api["id"] == id:
-            api["subIds"] = subIds
-            break
-    # save the apis to the apis_file_path
-    return save_apis_to_file(apis)
+    # update the subIds of the api by api_id
+    api_catalog_store.update_api_fields(id, {"subIds": subIds}, operator)
+    return {"status": SysConstants.STATUS_SUCCESS.value}
 
 
-def delete_sub_api(id, subId):
-    # get all open APIs
-    apis = get_apis()
-    # filter the api by api_id
-    for api in apis:
-        if api["id"] == id:
-            if subId in api["subIds"]:
-                api["subIds"].remove(subId)
-            break
-    # save the apis to the apis_file_path
-    return save_apis_to_file(apis)
-
-
-def save_apis_to_file(apis):
-    # get the api_tree module config
-    api_tree_conf = file_tools.load_module_config_file("api_tree")
-    # get the apis_file_path for updating
-    apis_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{api_tree_conf['apis_file_path']}"
-    file_tools.write_json_to_file(apis, apis_file_path)
+def delete_sub_api(id, subId, operator=None):
+    with api_catalog_store.catalog_lock:
+        api = api_catalog_store.get_api(id)
+        # remove subId from the subIds of the api by api_id
+        if api and subId in api.get("subIds", []):
+            api_catalog_store.update_api_fields(id, {"subIds": [sub_id for sub_id in api["subIds"] if sub_id != subId]}, operator)
     return {"status": SysConstants.STATUS_SUCCESS.value}
 
 
-def export_api_info_to_excel(excel_file_path, uri, uriSearchMode, httpMethod, classification, belongs_to_application,
-                             channel, swagger_title, api_name):
-    # get all open APIs
-    all_apis = get_apis()
-    # filter the api by
-    #   uri(partially match ignore case, also need to consider the variables in uri),
-    #   uriSearchMode (exact match or partial match),
-    #   httpMethod(partially match ignore case),
-    #   classification(partially match ignore case),
-    #   belongs_to_application(partially match ignore case),
-    #   channel(partially match ignore case),
-    #   swagger_title(partially match ignore case),
-    #   api_name(partially match ignore case),
-    # if the parameter is empty, it will not be used to filter
-    filtered_apis = []
-    for api in all_apis:
-        # exact match
-        if uriSearchMode == SysConstants.API_URI_SEARCH_MODE_EXACT.value:
-            # call string_tools.exact_match_uri_with_variables to check if the uri is exactly matched
-            if ((string_tools.exact_match_uri_with_variables(uri, api["uri"])) and
-                    (httpMethod.lower() in api["httpMethod"].lower() if httpMethod else True) and
-                    (classification.lower() in api["classification"].lower() if classification else True) and
-                    (belongs_to_application.lower() in api["belongsToApplication"].lower() if belongs_to_application else True) and
-                    (channel.lower() in api["channel"].lower() if channel else True) and
-                    (swagger_title.lower() in api["swaggerTitle"].lower() if swagger_title else True) and
-                    (api_name.lower() in api["apiName"].lower() if api_name else True)):
-                filtered_apis.append(api)
-        # partial match
-        else:
-            # call string_tools.partial_match_uri_with_variables to check if the uri is partially matched
-            if ((string_tools.partial_match_uri_with_variables(uri, api["uri"])) and
-                    (httpMethod.lower() in api["httpMethod"].lower() if httpMethod else True) and
-                    (classification.lower() in api["classification"].lower() if classification else True) and
-                    (belongs_to_application.lower() in api["belongsToApplication"].lower() if belongs_to_application else True) and
-                    (channel.lower() in api["channel"].lower() if channel else True) and
-                    (swagger_title.lower() in api["swaggerTitle"].lower() if swagger_title else True) and
-                    (api_name.lower() in api["apiName"].lower() if api_name else True)):
-                filtered_apis.append(api)
+def get_parent_apis(api_id, transitive=False):
+    """get the apis which call api_id, i.e. have api_id in their subIds
+    if transitive, also get the callers of the callers, until the top level apis
+    """
+    with api_catalog_store.catalog_lock:
+        parent_ids = api_catalog_store.get_parent_ids(api_id)
+        if transitive:
+            # breadth first through the reverse index, the visited ones are skipped to avoid endless loop for cyclic subIds
+            pending = list(parent_ids)
+            while pending:
+                next_pending = []
+                for parent_id in pending:
+                    for grand_parent_id in api_catalog_store.get_parent_ids(parent_id):
+                        if grand_parent_id not in parent_ids:
+                            parent_ids.add(grand_parent_id)
+                            next_pending.append(grand_parent_id)
+                pending = next_pending
+            parent_ids.discard(api_id)
+        return api_catalog_store.get_apis_by_ids(parent_ids)
+
+
+def get_api_change_history(api_id):
+    # the changes of the api recorded in journal mode, the oldest first
+    return api_catalog_store.get_change_history(api_id)
+
+
+def filter_apis(uri, uri_search_mode, http_method, classification, belongs_to_application, channel, swagger_title, api_name):
+    """filter the apis by
+      uri(partially match ignore case, also need to consider the variables in uri),
+      uri_search_mode (exact match or partial match),
+      http_method(partially match ignore case),
+      classification(partially match ignore case),
+      belongs_to_application(partially match ignore case),
+      channel(partially match ignore case),
+      swagger_title(partially match ignore case),
+      api_name(partially match ignore case),
+    if the parameter is empty, it will not be used to filter
+    the uri is looked up in the route trie and the other fields in their inverted indexes, so no API is scanned
+    """
+    field_filters = {
+        'httpMethod': http_method,
+        'classification': classification,
+        'belongsToApplication': belongs_to_application,
+        'channel': channel,
+        'swaggerTitle': swagger_title,
+        'apiName': api_name
+    }
+    with api_catalog_store.catalog_lock:
+        matched_api_ids = None
+        if uri:
+            uri_trie = api_catalog_store.get_uri_trie()
+            if uri_search_mode == SysConstants.API_URI_SEARCH_MODE_EXACT.value:
+                # same as string_tools.exact_match_uri_with_variables
+                matched_api_ids = uri_trie_tools.find_matched_by_template(uri_trie, uri)
+            else:
+                # same as string_tools.partial_match_uri_with_variables
+                matched_api_ids = uri_trie_tools.find_matched_by_prefix(uri_trie, uri)
+
+        for field, keyword in field_filters.items():
+            if not keyword:
+                continue
+            field_api_ids = api_catalog_store.find_api_ids_by_field(field, keyword)
+            matched_api_ids = field_api_ids if matched_api_ids is None else matched_api_ids & field_api_ids
+
+        if matched_api_ids is None:
+            return get_apis()
+        return api_catalog_store.get_apis_by_ids(matched_api_ids)
+
+
+def search_apis(uri, uri_search_mode, http_method, classification, belongs_to_application, channel, swagger_title, api_name,
+                sort_by='createTime', sort_order='desc', offset=0, limit=SysConstants.API_SEARCH_DEFAULT_PAGE_SIZE.value, cursor=None):
+    """filter the apis in the same way as filter_apis, then sort and return 1 page of them
+    the page starts either from offset, or right after cursor which is the nextCursor of the previous page
+    """
+    filtered_apis = filter_apis(uri, uri_search_mode, http_method, classification, belongs_to_application, channel, swagger_title, api_name)
+
+    # sort by the field and then by id, so the order is stable and each sort key is unique
+    def get_sort_key(api):
+        return [str(api.get(sort_by) or '').lower(), api["id"]]
+
+    # a typo such as 'ascending' is rejected, instead of sorting in the wrong order
+    if sort_order.lower() not in ('asc', 'desc'):
+        raise ValueError(f"invalid sort order: {sort_order}")
+    is_desc = sort_order.lower() == 'desc'
+    filtered_apis = sorted(filtered_apis, key=get_sort_key, reverse=is_desc)
+
+    start = offset
+    if cursor:
+        # the cursor is the sort key of the last api in the previous page
+        cursor_key = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        # a cursor which can be decoded but isn't a sort key can't be compared with the sort keys
+        if not isinstance(cursor_key, list) or len(cursor_key) != 2 or not all(isinstance(value, str) for value in cursor_key):
+            raise ValueError(f"invalid cursor: {cursor}")
+        start = next((index for index, api in enumerate(filtered_apis)
+                      if (get_sort_key(api) < cursor_key if is_desc else get_sort_key(api) > cursor_key)), len(filtered_apis))
+    page_apis = filtered_apis[start:start + limit]
+
+    next_cursor = None
+    if start + limit < len(filtered_apis):
+        next_cursor = base64.urlsafe_b64encode(json.dumps(get_sort_key(page_apis[-1])).encode()).decode()
+
+    return {"status": SysConstants.STATUS_SUCCESS.value, "apis": page_apis, "total": len(filtered_apis),
+            "offset": start, "limit": limit, "nextCursor": next_cursor}
+
+
+def get_api_tree():
+    """get the parent / child structure of all the apis, it's cached until the catalog changes, with format as below
+    {
+        "apis": {api_id: api},
+        "children": {api_id: [sub api ids, only the existing ones]},
+        "depths": {api_id: depth},      // 0 for the apis which are not a sub api of any other api
+        "roots": [api_id]               // the apis which are not a sub api of any other api
+    }
+    """
+    with api_catalog_store.catalog_lock:
+        version = api_catalog_store.get_version()
+        with _api_tree_cache_lock:
+            if _api_tree_cache["version"] == version:
+                return _api_tree_cache["tree"]
+        apis = get_apis()
+
+    api_map = {api["id"]: api for api in apis}
+    children = {}
+    sub_api_ids = set()
+    for api in apis:
+        children[api["id"]] = [sub_id for sub_id in api.get("subIds", []) if sub_id in api_map]
+        sub_api_ids.update(children[api["id"]])
+    roots = [api["id"] for api in apis if api["id"] not in sub_api_ids]
+
+    # breadth first from the roots, the depth is the shortest distance to a root
+    depths = {}
+    for root_id in roots + [api["id"] for api in apis]:
+        # the apis only referenced inside a cycle are not reachable from any root, take the 1st one as a root
+        if root_id in depths:
+            continue
+        if root_id not in roots:
+            roots.append(root_id)
+        depths[root_id] = 0
+        pending = [root_id]
+        while pending:
+            next_pending = []
+            for api_id in pending:
+                for sub_id in children[api_id]:
+                    if sub_id not in depths:
+                        depths[sub_id] = depths[api_id] + 1
+                        next_pending.append(sub_id)
+            pending = next_pending
+
+    tree = {"apis": api_map, "children": children, "depths": depths, "roots": roots}
+    with _api_tree_cache_lock:
+        _api_tree_cache["version"] = version
+        _api_tree_cache["tree"] = tree
+    return tree
+
+
+def get_api_tree_view():
+    """get the nested api tree for the UI tree view, with format as below
+    [
+        {
+            "api": {...},
+            "depth": 0,
+            "expanded": true,
+            "children": [{"api": {...}, "depth": 1, "expanded": true, "children": []}]
+        }
+    ]
+    a sub api shared by many parents is expanded only at its 1st appearance, and the tree stops at API_TREE_VIEW_MAX_DEPTH,
+    the other appearances have "expanded": false and no children, the UI gets their sub apis by subIds of the api
+    """
+    api_tree = get_api_tree()
+    max_depth = SysConstants.API_TREE_VIEW_MAX_DEPTH.value
+    expanded_api_ids = set()
+
+    def build_node(api_id, depth):
+        # each api is expanded only once, it also stops the endless loop for cyclic subIds
+        expanded = api_id not in expanded_api_ids and depth < max_depth
+        if expanded:
+            expanded_api_ids.add(api_id)
+        return {
+            "api": api_tree["apis"][api_id],
+            "depth": depth,
+            "expanded": expanded,
+            "children": [build_node(sub_id, depth + 1) for sub_id in api_tree["children"][api_id]] if expanded else []
+        }
+
+    return [build_node(api_id, 0) for api_id in api_tree["roots"]]
+
+
+# the exported fields of each api, and the headers / widths of the columns, 'NO.' is the 1st column
+EXPORT_COLUMNS_ORDER = [
+    'uri', 'httpMethod', 'classification', 'belongsToApplication', 'channel',
+    'swaggerTitle', 'serviceName', 'apiName', 'bianBehaviorQualifier', 'subQualifier',
+    'bianAdoptionLevel', 'apiStatus', 'remark'
+]
+EXPORT_COLUMN_HEADERS = [
+    'NO.', 'URI', 'Http Method', 'Classification', 'Belogs to Application', 'Channel',
+    'Swagger Title', 'Service Name', 'API Name', 'BIAN Behavior Qualifier', 'Sub Qualifier',
+    'BIAN Adoption Level', 'Status', 'Remark'
+]
+EXPORT_COLUMN_WIDTHS = [
+    5, 100, 15, 20, 25, 10, 30, 30, 30, 25, 20, 20, 10, 50
+]
+
+
+def get_export_api_rows(uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name):
+    """yield the exported rows one by one, with format (no, api, is_sub_api)
+    each filtered api is followed by its sub apis, the sub apis have no 'NO.' and their uri is indented by 4 blanks
+    """
+    # get the id -> api map once, it's used to resolve the sub apis
+    api_map = get_api_tree()["apis"]
+    # filter the api by uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name
+    filtered_apis = filter_apis(uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name)
 
     # sort the apis by createTime desc, make it align with UI
     filtered_apis = sorted(filtered_apis, key=lambda x: x["createTime"], reverse=True)
-    # start to write apis into Excel
-    # get the json object from file /conf/api_tree_config.json
-    with pd.ExcelWriter(excel_file_path, engine='xlsxwriter') as writer:
-        workbook = writer.book
+    for no_counter, record in enumerate(filtered_apis, start=1):
+        yield no_counter, record, False
+        for sub_id in record.get('subIds', []):
+            # get the subapi details
+            sub_record = api_map.get(sub_id)
+            if sub_record:
+                # clone the sub_record to avoid changing the original record, and append 4 blanks before uri
+                yield '', {**sub_record, 'uri': '    ' + sub_record['uri']}, True
+
+
+def export_api_info_to_excel(excel_file_path, uri, uriSearchMode, httpMethod, classification, belongs_to_application,
+                             channel, swagger_title, api_name):
+    # constant_memory mode flushes each row to the disk once the next row is started, so the memory doesn't grow with the rows
+    workbook = xlsxwriter.Workbook(excel_file_path, {'constant_memory': True})
+    try:
         worksheet = workbook.add_worksheet('APIs')
 
         # Add formats for the rows
         main_format = workbook.add_format({'bg_color': '#D7E4BC'})
         header_format = workbook.add_format({'bg_color': '#A9A9A9', 'bold': True})
 
-        genarate_api_expended_excel(all_apis, filtered_apis, worksheet, main_format, header_format)
+        api_rows = get_export_api_rows(uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name)
+        genarate_api_expended_excel(api_rows, worksheet, main_format, header_format)
+    finally:
+        workbook.close()
 
 
-def genarate_api_expended_excel(all_apis, filtered_apis, worksheet, main_format, header_format):
-    columns_order = [
-        'uri', 'httpMethod', 'classification', 'belongsToApplication', 'channel',
-        'swaggerTitle', 'serviceName', 'apiName', 'bianBehaviorQualifier', 'subQualifier',
-        'bianAdoptionLevel', 'apiStatus', 'remark'
-    ]
-
-    column_headers = [
-        'NO.', 'URI', 'Http Method', 'Classification', 'Belogs to Application', 'Channel',
-        'Swagger Title', 'Service Name', 'API Name', 'BIAN Behavior Qualifier', 'Sub Qualifier',
-        'BIAN Adoption Level', 'Status', 'Remark'
-    ]
-
-    column_widths = [
-        5, 100, 15, 20, 25, 10, 30, 30, 30, 25, 20, 20, 10, 50
-    ]
-
+def genarate_api_expended_excel(api_rows, worksheet, main_format, header_format):
     # Write the header
-    for col_num, (column, width) in enumerate(zip(column_headers, column_widths)):
+    for col_num, (column, width) in enumerate(zip(EXPORT_COLUMN_HEADERS, EXPORT_COLUMN_WIDTHS)):
         worksheet.write(0, col_num, column, header_format)
         worksheet.set_column(col_num, col_num, width)
 
-    row_num = 1
-    no_counter = 1
-    for record in filtered_apis:
-        # Write main record
-        worksheet.write(row_num, 0, no_counter, main_format)
-        for col_num, column in enumerate(columns_order, start=1):
-            worksheet.write(row_num, col_num, record.get(column, ''), main_format)
-        row_num += 1
-        no_counter += 1
-
-        # Write sub-records
-        for sub_id in record.get('subIds', []):
-            # get the subapi details
-            sub_record = next((item for item in all_apis if item['id'] == sub_id), None)
-            if sub_record:
-                # clone the sub_record to avoid changing the original record
-                temp_sub_record = sub_record.copy()
-                # append 4 blanks before uri
-                temp_sub_record['uri'] = '    ' + temp_sub_record['uri']
-                for col_num, column in enumerate(columns_order, start=1):
-                    worksheet.write(row_num, col_num, temp_sub_record.get(column, ''))
-                # group the sub-records rows
-                worksheet.set_row(row_num, None, None, {'level': 1, 'hidden': True})
-                row_num += 1
+    # the rows must be written in order in constant_memory mode
+    for row_num, (no_counter, record, is_sub_api) in enumerate(api_rows, start=1):
+        if is_sub_api:
+            # group the sub-records rows, set before writing the cells of the row
+            worksheet.set_row(row_num, None, None, {'level': 1, 'hidden': True})
+            for col_num, column in enumerate(EXPORT_COLUMNS_ORDER, start=1):
+                worksheet.write(row_num, col_num, record.get(column, ''))
+        else:
+            # Write main record
+            worksheet.write(row_num, 0, no_counter, main_format)
+            for col_num, column in enumerate(EXPORT_COLUMNS_ORDER, start=1):
+                worksheet.write(row_num, col_num, record.get(column, ''), main_format)
+
+
+def generate_api_info_csv(uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name):
+    # yield the csv lines one by one, the columns are the same as the Excel file
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMN_HEADERS)
+    # the header is sent even if no api is matched
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    for no_counter, record, is_sub_api in get_export_api_rows(uri, uriSearchMode, httpMethod, classification, belongs_to_application,
+                                                              channel, swagger_title, api_name):
+        writer.writerow([no_counter] + [record.get(column, '') for column in EXPORT_COLUMNS_ORDER])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def generate_api_info_ndjson(uri, uriSearchMode, httpMethod, classification, belongs_to_application, channel, swagger_title, api_name):
+    # yield 1 json line for each api, the sub apis are marked by field 'isSubApi'
+    for no_counter, record, is_sub_api in get_export_api_rows(uri, uriSearchMode, httpMethod, classification, belongs_to_application,
+                                                              channel, swagger_title, api_name):
+        yield json.dumps({"no": no_counter, "isSubApi": is_sub_api, **{column: record.get(column, '') for column in EXPORT_COLUMNS_ORDER}},
+                         ensure_ascii=False) + '\n'
 
 
 def get_http_methods_by_uri(input_uri):
-    # get all apis
-    api_data = get_apis()
-
-    uri_methods = defaultdict(list)
-    normalized_input_uri = string_tools.normalize_uri(input_uri)
-
-    for api in api_data:
-        uri = api.get('uri')
-        http_method = api.get('httpMethod')
-        if uri and http_method:
-
-            normalized_uri = string_tools.normalize_uri(uri)
-            uri_methods[normalized_uri].append(http_method)
-
-    return uri_methods.get(normalized_input_uri, [])
+    # find the APIs which have the same normalized uri from the route trie
+    with api_catalog_store.catalog_lock:
+        uri_trie = api_catalog_store.get_uri_trie()
+        matched_entries = uri_trie_tools.find_exact(uri_trie, input_uri)
+
+    http_methods = []
+    for http_method, api_ids in matched_entries.items():
+        http_methods.extend([http_method] * len(api_ids))
+    return http_methods
@@ -0,0 +1,298 @@
+"""
+the shared Bitbucket client of bb contribution analysis
+1. all the requests go through 1 pooled requests.Session, so the connections (and TLS handshakes) are reused by keep-alive
+2. the pool is sized to the worker count, so each worker can keep its own connection
+3. the concurrent requests to the same host are limited by max_connections_per_host
+4. every request has a timeout, a hanging request won't block the worker forever
+5. the requests to the same host are limited by a token bucket, its rate is adapted by AIMD:
+   it increases a little after each success, and it's halved when Bitbucket returns 429/5xx or the request times out
+6. the throttled and failed requests are retried with exponential backoff and jitter, Retry-After is honored if returned
+7. the metrics are collected for each endpoint, such as /projects/{projectKey}/repos/{repoSlug}/branches
+"""
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+from common_tools import file_tools
+from consts.sys_constants import SysConstants
+
+DEFAULT_MAX_WORKERS = 5
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 5
+DEFAULT_REQUEST_TIMEOUT_IN_SECONDS = 30
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_RETRY_BASE_DELAY_IN_SECONDS = 1
+DEFAULT_RETRY_MAX_DELAY_IN_SECONDS = 60
+DEFAULT_RATE_LIMIT_PER_SECOND = 20
+DEFAULT_MIN_RATE_LIMIT_PER_SECOND = 1
+DEFAULT_MAX_RATE_LIMIT_PER_SECOND = 50
+# the status codes which mean Bitbucket is overloaded, the request is retried and the rate is decreased
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# the rate is decreased at most once in this period, so a burst of 429s doesn't drop the rate to the minimum at once
+RATE_DECREASE_INTERVAL_IN_SECONDS = 1
+
+_session = None
+# the semaphores to limit the concurrent requests, with format {host: BoundedSemaphore}
+_host_semaphores = {}
+# the token buckets, with format {host: {rate, tokens, updated_time, paused_until, decreased_time}}
+_rate_limiters = {}
+# the metrics, with format {endpoint: {requests, succeeded, failed, retried, throttled, server_errors, exceptions, total_time, max_time}}
+_endpoint_metrics = {}
+_client_lock = threading.Lock()
+
+_ENDPOINT_PATTERNS = [
+    (re.compile(r'/projects/[^/]+'), '/projects/{projectKey}'),
+    (re.compile(r'/repos/[^/]+'), '/repos/{repoSlug}'),
+    (re.compile(r'/commits/[0-9a-fA-F]{7,40}'), '/commits/{commitId}'),
+]
+
+
+def get_max_workers():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return max(1, bb_conf.get('max_workers', DEFAULT_MAX_WORKERS))
+
+
+def get_max_connections_per_host():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return max(1, bb_conf.get('max_connections_per_host', DEFAULT_MAX_CONNECTIONS_PER_HOST))
+
+
+def get_request_timeout():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return bb_conf.get('request_timeout_in_seconds', DEFAULT_REQUEST_TIMEOUT_IN_SECONDS)
+
+
+def get_retry_conf():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return (max(0, bb_conf.get('max_retries', DEFAULT_MAX_RETRIES)),
+            bb_conf.get('retry_base_delay_in_seconds', DEFAULT_RETRY_BASE_DELAY_IN_SECONDS),
+            bb_conf.get('retry_max_delay_in_seconds', DEFAULT_RETRY_MAX_DELAY_IN_SECONDS))
+
+
+def get_rate_limit_conf():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    min_rate = max(0.1, bb_conf.get('min_rate_limit_per_second', DEFAULT_MIN_RATE_LIMIT_PER_SECOND))
+    max_rate = max(min_rate, bb_conf.get('max_rate_limit_per_second', DEFAULT_MAX_RATE_LIMIT_PER_SECOND))
+    rate = min(max_rate, max(min_rate, bb_conf.get('rate_limit_per_second', DEFAULT_RATE_LIMIT_PER_SECOND)))
+    return rate, min_rate, max_rate
+
+
+def get_session():
+    global _session
+    with _client_lock:
+        if _session is None:
+            pool_size = max(get_max_workers(), get_max_connections_per_host())
+            session = requests.Session()
+            # pool_connections is the number of hosts kept in the pool, pool_maxsize is the connections kept for each host
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            # if this is windows, set verify as False
+            if file_tools.is_windows():
+                session.verify = False
+            _session = session
+        return _session
+
+
+def close_session():
+    global _session
+    with _client_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def get_host(url):
+    return urlsplit(url).netloc.lower()
+
+
+def get_endpoint_name(url):
+    # the ids in the path are replaced by placeholders, so the requests of all the repos are counted in the same endpoint
+    path = urlsplit(url).path
+    path = path.split('/rest/api/1.0', 1)[-1]
+    for pattern, placeholder in _ENDPOINT_PATTERNS:
+        path = pattern.sub(placeholder, path)
+    return path
+
+
+def _get_host_semaphore(host):
+    with _client_lock:
+        semaphore = _host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(get_max_connections_per_host())
+            _host_semaphores[host] = semaphore
+        return semaphore
+
+
+def _get_rate_limiter(host):
+    # call it with _client_lock
+    rate_limiter = _rate_limiters.get(host)
+    if rate_limiter is None:
+        rate, _, _ = get_rate_limit_conf()
+        now = time.monotonic()
+        rate_limiter = {"rate": rate, "tokens": 1.0, "updated_time": now, "paused_until": 0.0, "decreased_time": 0.0}
+        _rate_limiters[host] = rate_limiter
+    return rate_limiter
+
+
+def _acquire_token(host):
+    # wait until the token bucket of the host has a token, the bucket holds at most 1 second of requests
+    while True:
+        with _client_lock:
+            rate_limiter = _get_rate_limiter(host)
+            now = time.monotonic()
+            rate = rate_limiter['rate']
+            rate_limiter['tokens'] = min(max(1.0, rate), rate_limiter['tokens'] + (now - rate_limiter['updated_time']) * rate)
+            rate_limiter['updated_time'] = now
+            wait_time = rate_limiter['paused_until'] - now
+            if wait_time <= 0:
+                if rate_limiter['tokens'] >= 1:
+                    rate_limiter['tokens'] -= 1
+                    return
+                wait_time = (1 - rate_limiter['tokens']) / rate
+        time.sleep(wait_time)
+
+
+def _increase_rate(host):
+    _, _, max_rate = get_rate_limit_conf()
+    with _client_lock:
+        rate_limiter = _get_rate_limiter(host)
+        # additive increase, it takes about `rate` successes to increase 1 request per second
+        rate_limiter['rate'] = min(max_rate, rate_limiter['rate'] + 1 / rate_limiter['rate'])
+
+
+def _decrease_rate(host, retry_after=None):
+    _, min_rate, _ = get_rate_limit_conf()
+    with _client_lock:
+        rate_limiter = _get_rate_limiter(host)
+        now = time.monotonic()
+        # multiplicative decrease
+        if now - rate_limiter['decreased_time'] >= RATE_DECREASE_INTERVAL_IN_SECONDS:
+            rate_limiter['rate'] = max(min_rate, rate_limiter['rate'] / 2)
+            rate_limiter['tokens'] = min(rate_limiter['tokens'], 1.0)
+            rate_limiter['decreased_time'] = now
+        # Retry-After pauses all the requests to the host
+        if retry_after:
+            rate_limiter['paused_until'] = max(rate_limiter['paused_until'], now + retry_after)
+
+
+def get_retry_after(response):
+    # Retry-After is either the seconds to wait, or a http date
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_time = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_time - datetime.now(timezone.utc)).total_seconds())
+
+
+def get_backoff_delay(attempt, base_delay, max_delay):
+    # exponential backoff with full jitter, so the retries of the workers don't hit Bitbucket at the same time
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def _record_metrics(endpoint, elapsed_time, status_code=None, is_exception=False, is_retried=False, is_final=False):
+    with _client_lock:
+        metrics = _endpoint_metrics.get(endpoint)
+        if metrics is None:
+            metrics = {"requests": 0, "succeeded": 0, "failed": 0, "retried": 0, "throttled": 0, "server_errors": 0, "exceptions": 0, "total_time": 0.0, "max_time": 0.0}
+            _endpoint_metrics[endpoint] = metrics
+        metrics['requests'] += 1
+        metrics['total_time'] += elapsed_time
+        metrics['max_time'] = max(metrics['max_time'], elapsed_time)
+        if is_exception:
+            metrics['exceptions'] += 1
+        elif status_code == 429:
+            metrics['throttled'] += 1
+        elif status_code >= 500:
+            metrics['server_errors'] += 1
+        if is_retried:
+            metrics['retried'] += 1
+        if is_final:
+            if not is_exception and status_code < 400:
+                metrics['succeeded'] += 1
+            else:
+                metrics['failed'] += 1
+
+
+def get_metrics():
+    with _client_lock:
+        endpoint_metrics = {}
+        for endpoint, metrics in _endpoint_metrics.items():
+            endpoint_metrics[endpoint] = {
+                "requests": metrics['requests'],
+                "succeeded": metrics['succeeded'],
+                "failed": metrics['failed'],
+                "retried": metrics['retried'],
+                "throttled": metrics['throttled'],
+                "server_errors": metrics['server_errors'],
+                "exceptions": metrics['exceptions'],
+                "avg_time_in_ms": round(metrics['total_time'] * 1000 / metrics['requests']) if metrics['requests'] else 0,
+                "max_time_in_ms": round(metrics['max_time'] * 1000)
+            }
+        rate_limits = {host: round(rate_limiter['rate'], 2) for host, rate_limiter in _rate_limiters.items()}
+    return {"endpoints": endpoint_metrics, "rate_limits": rate_limits}
+
+
+def reset_metrics():
+    with _client_lock:
+        _endpoint_metrics.clear()
+
+
+def get(url, username, app_password):
+    session = get_session()
+    host = get_host(url)
+    endpoint = get_endpoint_name(url)
+    max_retries, base_delay, max_delay = get_retry_conf()
+
+    response = None
+    for attempt in range(max_retries + 1):
+        _acquire_token(host)
+        response = None
+        error = None
+        start_time = time.monotonic()
+        # wait for a free slot of the host, then send the request with the pooled connection
+        with _get_host_semaphore(host):
+            try:
+                response = session.get(url, auth=HTTPBasicAuth(username, app_password), timeout=get_request_timeout())
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+        elapsed_time = time.monotonic() - start_time
+
+        is_retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+        retry_after = get_retry_after(response) if is_retryable else None
+        # don't wait longer than max_delay, give up if Bitbucket asks for more, such as Retry-After: 3600
+        is_retried = is_retryable and attempt < max_retries and (retry_after is None or retry_after <= max_delay)
+        _record_metrics(endpoint, elapsed_time, response.status_code if response is not None else None, error is not None, is_retried, not is_retried)
+        if not is_retryable:
+            _increase_rate(host)
+            return response
+
+        # the other requests to the host are paused for at most max_delay too
+        _decrease_rate(host, min(retry_after, max_delay) if retry_after is not None else None)
+        if not is_retried:
+            break
+
+        delay = retry_after if retry_after is not None else get_backoff_delay(attempt, base_delay, max_delay)
+        print(f"Retry {attempt + 1}/{max_retries} in {delay:.1f}s for {endpoint}: {error if error is not None else response.status_code}")
+        time.sleep(delay)
+
+    # all the retries failed, raise the last error, or return the last failed response to the caller
+    if response is None:
+        raise error
+    return response
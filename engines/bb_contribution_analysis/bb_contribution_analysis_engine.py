@@ -1,22 +1,25 @@
 import threading
-import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime, timedelta
 
 import pandas
-import requests
-from requests.auth import HTTPBasicAuth
 
 from common_tools import file_tools
 from consts.sys_constants import SysConstants
+from engines.bb_contribution_analysis import bb_client
+
+# the pr states which won't change any more, the commits with these prs only are not looked up again
+PR_TERMINAL_STATES = {'MERGED', 'DECLINED'}
+
+# the progress of the refresh, it's returned together with the refresh info
+_refresh_progress = {}
+_refresh_progress_lock = threading.Lock()
 
 
 def getFromBB(url, username, app_password):
-    # if this is windows, set verify as False
-    if file_tools.is_windows():
-        verify = False
-        return requests.get(url, auth=HTTPBasicAuth(username, app_password), verify=verify)
-    else:
-        return requests.get(url, auth=HTTPBasicAuth(username, app_password))
+    # the shared client reuses the pooled connections, and limits the concurrent requests per host
+    return bb_client.get(url, username, app_password)
 
 
 # write a function to get the branches
@@ -34,15 +37,8 @@ def get_branches(base_url, project_key, repo_slug):
     if branches_response.status_code == 200:
         return branches_response.json()
     else:
-        # error log the branches_response as string
+        # error log the branches_response as string, the throttled and failed requests are already retried by the client
         print(f'Failed to retrieve branches: {branches_response.status_code}, {branches_response.content}')
-        # retry maximum 3 times, until branches_response.status_code == 200
-        for i in range(3):
-            branches_response = getFromBB(branches_url, username, app_password)
-            if branches_response.status_code == 200:
-                return branches_response.json()
-            else:
-                print(f'Retry to fetch the branches - time {i}, Failed to retrieve branches: {branches_response.status_code}, {branches_response.content}')
         return {}
 
 
@@ -67,13 +63,19 @@ def remove_commits_not_in_period(commit_records, start_time, end_time):
     return [commit for commit in commit_records if under_period(commit['commit_time'], start_time, end_time)], set([commit['id'] for commit in commit_records])
 
 
-def get_commits_under_repo_branches(repo_link, base_url, project_key, repo_slug, branches, start_time, end_time, default_branch, only_default_branch=False):
+def get_contribution_file_path(repo_slug, only_default_branch=False):
     bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
-    username = bb_conf['bb_username']
-    app_password = bb_conf['bb_password']
-    commit_page_size = bb_conf['commit_page_size']
-    # if default_branches has displayId, default_branch_name = default_branches['displayId']
-    default_branch_name = default_branch['displayId'] if 'displayId' in default_branch else ''
+    # if is_partial_repos, load the partial repos file, otherwise load all repos file
+    is_partial_repos = bb_conf['is_partial_repos']
+    if only_default_branch:
+        return f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['default_partial_contribution_file_path']}/{repo_slug}.json" if is_partial_repos else f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['default_all_contribution_file_path']}/{repo_slug}.json"
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['partial_contribution_file_path']}/{repo_slug}.json" if is_partial_repos else f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['all_contribution_file_path']}/{repo_slug}.json"
+
+
+# write a function to fetch the commits of 1 branch under period, page by page
+# if since_commit is given, only the commits between since_commit and the branch head are fetched
+# return (commits, is_success), is_success is False when any page can't be loaded
+def fetch_branch_commits(repo_link, base_url, project_key, repo_slug, branch_name, start_time, end_time, since_commit=None):
     """
     this is the funtion to get all the commits under a repo and a branch
     1. get the commits under each branch which is under period and the maker soeid is in soeids
@@ -161,16 +163,69 @@ def get_commits_under_repo_branches(repo_link, base_url, project_key, repo_slug,
         ]
     }
     """
-    temp_file_path = ''
-    # if only_default_branch,
-    if only_default_branch:
-        # if is_partial_repos, load the partial repos file, otherwise load all repos file
-        is_partial_repos = bb_conf['is_partial_repos']
-        temp_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['default_partial_contribution_file_path']}/{repo_slug}.json" if is_partial_repos else f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['default_all_contribution_file_path']}/{repo_slug}.json"
-    else:
-        # if is_partial_repos, load the partial repos file, otherwise load all repos file
-        is_partial_repos = bb_conf['is_partial_repos']
-        temp_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['partial_contribution_file_path']}/{repo_slug}.json" if is_partial_repos else f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf['all_contribution_file_path']}/{repo_slug}.json"
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    username = bb_conf['bb_username']
+    app_password = bb_conf['bb_password']
+    commit_page_size = bb_conf['commit_page_size']
+    since_param = f'&since={since_commit}' if since_commit else ''
+
+    branch_commits = []
+    # Bitbucket API endpoint to get commits for each branch, and filter by period and soeid
+    commits_url = f'{base_url}/rest/api/1.0/projects/{project_key}/repos/{repo_slug}/commits?merges=exclude&until={branch_name}{since_param}&limit={commit_page_size}'
+    # Make the API request to get commits for the branch
+    commits_response = getFromBB(commits_url, username, app_password)
+    if commits_response.status_code != 200:
+        print(f'Failed to retrieve commits for branch {branch_name}: {commits_response.status_code}, {commits_response.content}')
+        return [], False
+
+    commits = commits_response.json()
+    formatted_commits, is_next_required = filter_and_reformat_commits(repo_link, branch_name, commits, start_time, end_time)
+    branch_commits.extend(formatted_commits)
+
+    # Check if there is a next page of commits, if not required to get next page, stop here
+    next_page_start = commits.get('nextPageStart', None) if is_next_required else None
+    while next_page_start:
+        # Bitbucket API endpoint to get next page of commits
+        next_page_url = f'{base_url}/rest/api/1.0/projects/{project_key}/repos/{repo_slug}/commits?merges=exclude&until={branch_name}{since_param}&limit={commit_page_size}&start={next_page_start}'
+        # Make the API request to get the next page of commits
+        next_page_response = getFromBB(next_page_url, username, app_password)
+        if next_page_response.status_code != 200:
+            print(f'Failed to retrieve next page of commits for branch {branch_name}: {next_page_response.status_code}')
+            return branch_commits, False
+
+        next_page_commits = next_page_response.json()
+        formatted_commits, is_next_required = filter_and_reformat_commits(repo_link, branch_name, next_page_commits, start_time, end_time)
+        branch_commits.extend(formatted_commits)
+
+        # if not required to get next page, break the loop
+        if not is_next_required:
+            break
+
+        # Check if there is a next page of commits
+        next_page_start = next_page_commits.get('nextPageStart', None)
+    return branch_commits, True
+
+
+# write a function to merge the commits of 1 branch into commits_by_id, avoid duplicate record by field "id"
+# commits_by_id is the commits of the repo, with format {commit_id: commit}
+def merge_branch_commits(commits_by_id, unique_commit_ids, formatted_commits, branch_name, default_branch_name):
+    for commit in formatted_commits:
+        # find the commit by field "id" in the existing commits
+        matched_commit = commits_by_id.get(commit['id'])
+        # if matched_commit, and its field branch value != default_branch_name, update the branch value as branch_name
+        if default_branch_name and matched_commit and matched_commit['branch'] != default_branch_name:
+            matched_commit['branch'] = branch_name
+            continue
+
+        if commit['id'] not in unique_commit_ids:
+            unique_commit_ids.add(commit['id'])
+            commits_by_id[commit['id']] = commit
+
+
+# write a function to merge the fetched commits of the branches into the contribution file of the repo
+# branch_commits is a list of (branch_name, commits), the branches are merged in the order of the list
+def save_repo_commits(repo_slug, branch_commits, start_time, end_time, default_branch_name, only_default_branch=False):
+    temp_file_path = get_contribution_file_path(repo_slug, only_default_branch)
 
     all_commits = []
 
@@ -181,75 +236,16 @@ def get_commits_under_repo_branches(repo_link, base_url, project_key, repo_slug,
     # remove expired commits
     all_commits, unique_commit_ids = remove_commits_not_in_period(all_commits, start_time, end_time)
 
-    for branch in branches['values']:
-        branch_name = branch['displayId']
-        # Bitbucket API endpoint to get commits for each branch, and filter by period and soeid
-        commits_url = f'{base_url}/rest/api/1.0/projects/{project_key}/repos/{repo_slug}/commits?merges=exclude&until={branch_name}&limit={commit_page_size}'
-        # Make the API request to get commits for the branch
-        commits_response = getFromBB(commits_url, username, app_password)
-        if commits_response.status_code == 200:
-            commits = commits_response.json()
-            formatted_commits, is_next_required = filter_and_reformat_commits(repo_link, branch_name, commits, start_time, end_time)
-            # flat the formatted_commits in the list, avoid duplicate record by field "id"
-            for commit in formatted_commits:
-                # find the commit by field "id" in all_commits (existing commits)
-                matched_commit = next((item for item in all_commits if item['id'] == commit['id']), None)
-                # if matched_commit, and its field branch value != default_branch_name, update the branch value as branch_name
-                if default_branch_name and matched_commit and matched_commit['branch'] != default_branch_name:
-                    matched_commit['branch'] = branch_name
-                    # replace it in all_commits
-                    all_commits = [commit if commit['id'] == matched_commit['id'] else commit for commit in all_commits]
-                    continue
+    # the commits are merged by id, the 1st record is kept if the file has duplicate ids
+    commits_by_id = {}
+    for commit in all_commits:
+        commits_by_id.setdefault(commit['id'], commit)
 
-                if commit['id'] not in unique_commit_ids:
-                    unique_commit_ids.add(commit['id'])
-                    all_commits.append(commit)
-
-            # if not required to get next page, continue to next branch
-            if not is_next_required:
-                continue
-
-            # Check if there is a next page of commits
-            next_page_start = commits.get('nextPageStart', None)
-            while next_page_start:
-                # Bitbucket API endpoint to get next page of commits
-                next_page_url = f'{base_url}/rest/api/1.0/projects/{project_key}/repos/{repo_slug}/commits?exclude&until={branch_name}&limit={commit_page_size}&start={next_page_start}'
-                # Make the API request to get the next page of commits
-                next_page_response = getFromBB(next_page_url, username, app_password)
-                if next_page_response.status_code == 200:
-                    next_page_commits = next_page_response.json()
-                    formatted_commits, is_next_required = filter_and_reformat_commits(repo_link, branch_name, next_page_commits, start_time, end_time)
-                    # flat the formatted_commits in the list, avoid duplicate record by field "id"
-                    for commit in formatted_commits:
-                        # find the commit by field "id" in all_commits (existing commits)
-                        matched_commit = next((item for item in all_commits if item['id'] == commit['id']), None)
-                        # if matched_commit, and its field branch value != default_branch_name and != branch_name, update the branch value as branch_name
-                        if default_branch_name and matched_commit and matched_commit['branch'] != default_branch_name and matched_commit['branch'] != branch_name:
-                            matched_commit['branch'] = branch_name
-                            # replace it in all_commits
-                            all_commits = [commit if commit['id'] == matched_commit['id'] else commit for commit in all_commits]
-                            continue
-
-                        if commit['id'] not in unique_commit_ids:
-                            unique_commit_ids.add(commit['id'])
-                            all_commits.append(commit)
-
-                    # if not required to get next page, break the loop
-                    if not is_next_required:
-                        break
-
-                    # Check if there is a next page of commits
-                    next_page_start = next_page_commits.get('nextPageStart', None)
-                else:
-                    print(f'Failed to retrieve next page of commits for branch {branch_name}: {next_page_response.status_code}')
-                    break
-        else:
-            print(f'Failed to retrieve commits for branch {branch_name}: {commits_response.status_code}, {commits_response.content}')
-            # Retry for 3 times, until commits_response.status_code == 200
-            break
+    for branch_name, commits in branch_commits:
+        merge_branch_commits(commits_by_id, unique_commit_ids, commits, branch_name, default_branch_name)
 
     # before writing the commits to a file: /static/bb_contribution_analysis/{repo_slug}.json, sort the commits by commit_time desc
-    all_commits.sort(key=lambda x: x['commit_time'], reverse=True)
+    all_commits = sorted(commits_by_id.values(), key=lambda x: x['commit_time'], reverse=True)
     file_tools.write_json_to_file(all_commits, temp_file_path)
 
 
@@ -548,44 +544,16 @@ def filter_commits(soeids, start_date, end_date, only_default_branch=False):
     return commit_records
 
 
-def process_repo_links(repo_links_subset, start_time, end_time):
-    for repo_link in repo_links_subset:
-        repo_slug = repo_link.split('repos/')[-1].split('/browse')[0]
-        project_key = repo_link.split('projects/')[-1].split('/repos')[0]
-        base_url = repo_link.split('/projects/')[0]
-        branches = get_branches(base_url, project_key, repo_slug)
-
-        # get the default branch for the repo
-        default_branch = get_default_branch(base_url, project_key, repo_slug)
-
-        if not default_branch:
-            print(f"Default branch not found for repo {repo_slug}, skip to next repo")
-            continue
-
-        if default_branch:
-            # deep clone branches to default_branches
-            default_branches = {'values': [default_branch]}
-            get_commits_under_repo_branches(repo_link, base_url, project_key, repo_slug, default_branches, start_time,
-                                          end_time, default_branch, True)
-
-        # if branches has no field 'values',continue
-        if 'values' not in branches:
-            print(f"Branches not found for repo {repo_slug}, skip to next repo")
-            continue
-
-        # if default branch is not in branches, add it into branches at the 1st position
-        # else reposition the default branch to the 1st position
-        if default_branch['displayId'] not in [branch['displayId'] for branch in branches['values']]:
-            branches['values'].insert(0, default_branch)
-        else:
-            for i, branch in enumerate(branches['values']):
-                if branch['displayId'] == default_branch['displayId']:
-                    branches['values'].insert(0, branches['values'].pop(i))
-                    break
-
-        get_commits_under_repo_branches(repo_link, base_url, project_key, repo_slug, branches, start_time, end_time, default_branch, False)
-
-    print(f"Finished loading commits for repo links subset: {repo_links_subset}")
+def move_default_branch_to_first(branches, default_branch):
+    # if default branch is not in branches, add it into branches at the 1st position
+    # else reposition the default branch to the 1st position
+    if default_branch['displayId'] not in [branch['displayId'] for branch in branches['values']]:
+        branches['values'].insert(0, default_branch)
+    else:
+        for i, branch in enumerate(branches['values']):
+            if branch['displayId'] == default_branch['displayId']:
+                branches['values'].insert(0, branches['values'].pop(i))
+                break
 
 
 # write a function to get the default branch for a repo
@@ -603,55 +571,365 @@ def get_default_branch(base_url, project_key, repo_slug):
         default_branch = default_branch_response.json()
         return default_branch
     else:
-        print(f'Failed to retrieve default branch: {default_branch_response.status_code}')
-        # Retry for 3 times, until default_branch_response.status_code == 200
-        for i in range(3):
-            default_branch_response = getFromBB(default_branch_url, username, app_password)
-            if default_branch_response.status_code == 200:
-                return default_branch_response.json()
-            else:
-                print(f'Retry to fetch the default branch - time {i}, Failed to retrieve default branch: {default_branch_response.status_code}, {default_branch_response.content}')
+        # the throttled and failed requests are already retried by the client
+        print(f'Failed to retrieve default branch: {default_branch_response.status_code}, {default_branch_response.content}')
         return {}
 
 
 def load_commits_for_all_repos():
-    # check and update the refresh info, if false, not allowed to get refresh
-    result = update_refresh_info()
-    if not result:
+    # only 1 refresh is allowed at the same time, it's marked as running before anything else
+    if not try_mark_refresh_running():
+        print("The commits are refreshing, skip this refresh")
         return
 
-    # get the repo links from json file
-    repo_links = get_flat_repo_links()
+    is_started = False
+    try:
+        # check and update the refresh info, if false, not allowed to get refresh
+        result = update_refresh_info()
+        if not result:
+            return
 
+        # get the repo links from json file
+        repo_links = get_flat_repo_links()
+
+        bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+        duration_by_days = bb_conf['duration_by_days']
+        # set current day as end time, so we need to add 1 day to the end time
+        end_time = get_tomorrow_midnight()
+        # set start time as end_time - duration_by_days
+        start_time = end_time - timedelta(days=duration_by_days)
+        print(f"start to analysys the contribution with Start time: {start_time}, End time: {end_time}")
+
+        start_refresh_progress(len(repo_links))
+        is_started = True
+        # the branches and pages of all the repos are loaded by a shared pool, so 1 slow repo doesn't block the others
+        run_repo_tasks(repo_links, start_time, end_time)
+
+        # call update_commit_pr_details once all the commits are loaded
+        print("All commits are loaded, start to update commit pr details using: update_commit_pr_details")
+        update_commit_pr_details()
+    finally:
+        if is_started:
+            finish_refresh_progress()
+        else:
+            unmark_refresh_running()
+
+
+def get_max_tasks_per_repo():
     bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
-    duration_by_days = bb_conf['duration_by_days']
-    # set current day as end time, so we need to add 1 day to the end time
-    end_time = get_tomorrow_midnight()
-    # set start time as end_time - duration_by_days
-    start_time = end_time - timedelta(days=duration_by_days)
-    print(f"start to analysys the contribution with Start time: {start_time}, End time: {end_time}")
-
-    # Split repo_links into multiple parts, run then in parallel for faster speed
-    # if len(repo_links) is greater than 5, set it as 5
-    num_threads = min(5, len(repo_links))
-    repo_links_parts = [repo_links[i::num_threads] for i in range(num_threads)]
-
-    # Create and start threads, each thread starts 1 second after previous one
-    threads = []
-    for i in range(num_threads):
-        # sleep for 1 second before starting the next thread
-        time.sleep(1)
-        thread = threading.Thread(target=process_repo_links, args=(repo_links_parts[i], start_time, end_time))
-        threads.append(thread)
-        thread.start()
-
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
-
-    # call update_commit_pr_details once all the commits are loaded
-    print("All commits are loaded, start to update commit pr details using: update_commit_pr_details")
-    update_commit_pr_details()
+    return max(1, bb_conf.get('max_tasks_per_repo', 2))
+
+
+def create_repo_state(repo_link):
+    """ the state of 1 repo during the refresh, with format as below
+    {
+        "repo_link": "https://.../projects/GBMO/repos/167407-web-borrow/browse",
+        "base_url": "https://.../bitbucket",
+        "project_key": "GBMO",
+        "repo_slug": "167407-web-borrow",
+        "default_branch": {},       // the default branch object from Bitbucket
+        "branch_names": [],         // all the branch names, the default branch is at the 1st position
+        "branch_commits": {},       // the fetched commits, with format {branch_name: (commits, is_success)}
+        "branch_watermarks": {},    // the branch heads of the last refresh, with format {branch_name: latest_commit_id}
+        "branch_heads": {},         // the branch heads of this refresh, with format {branch_name: latest_commit_id}
+        "pending_tasks": deque(),   // the tasks waiting for a worker, with format (function, args)
+        "running_tasks": 0,
+        "is_merged": False,
+        "is_failed": False
+    }
+    """
+    return {
+        "repo_link": repo_link,
+        "base_url": repo_link.split('/projects/')[0],
+        "project_key": repo_link.split('projects/')[-1].split('/repos')[0],
+        "repo_slug": repo_link.split('repos/')[-1].split('/browse')[0],
+        "default_branch": {},
+        "branch_names": [],
+        "branch_commits": {},
+        "branch_watermarks": {},
+        "branch_heads": {},
+        "pending_tasks": deque(),
+        "running_tasks": 0,
+        "is_merged": False,
+        "is_failed": False
+    }
+
+
+def run_repo_tasks(repo_links, start_time, end_time):
+    """ load the commits of the repos with a shared pool of max_workers
+    1. each repo starts with a task to load its branches, which creates 1 task for each branch
+    2. the free workers take the pending tasks from the repos by round robin, and each repo runs at most max_tasks_per_repo tasks,
+       so 1 repo with many branches can't take all the workers
+    3. once all the branches of a repo are loaded, the merge task of the repo writes its contribution files
+    4. the branch heads are saved as watermarks after the repo is merged, the unchanged branches are skipped in the next refresh
+    """
+    max_workers = bb_client.get_max_workers()
+    max_tasks_per_repo = get_max_tasks_per_repo()
+    repo_watermarks = load_branch_watermarks()
+    # the watermarks of the repos in this refresh, the failed repos keep their last watermarks
+    updated_repo_watermarks = {}
+
+    active_repo_states = deque()
+    for repo_link in repo_links:
+        repo_state = create_repo_state(repo_link)
+        repo_state['branch_watermarks'] = repo_watermarks.get(repo_state['repo_slug'], {})
+        repo_state['pending_tasks'].append((load_repo_branches_task, (repo_state,)))
+        active_repo_states.append(repo_state)
+    update_refresh_progress(total_tasks=len(active_repo_states))
+
+    # the running tasks, with format {future: repo_state}
+    running_futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while active_repo_states or running_futures:
+            # fill the free workers, 1 task from each repo per round
+            is_submitted = True
+            while is_submitted and len(running_futures) < max_workers:
+                is_submitted = False
+                for _ in range(len(active_repo_states)):
+                    repo_state = active_repo_states[0]
+                    active_repo_states.rotate(-1)
+                    if repo_state['pending_tasks'] and repo_state['running_tasks'] < max_tasks_per_repo:
+                        task, args = repo_state['pending_tasks'].popleft()
+                        running_futures[executor.submit(task, *args, start_time, end_time)] = repo_state
+                        repo_state['running_tasks'] += 1
+                        is_submitted = True
+                        if len(running_futures) >= max_workers:
+                            break
+
+            if not running_futures:
+                break
+
+            done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                repo_state = running_futures.pop(future)
+                repo_state['running_tasks'] -= 1
+                try:
+                    next_tasks = future.result()
+                except Exception as e:
+                    # the repo isn't merged when any of its tasks fails, to keep the existing contribution files
+                    print(f"Failed to load commits for repo {repo_state['repo_slug']}: {e}")
+                    repo_state['is_failed'] = True
+                    repo_state['pending_tasks'].clear()
+                    next_tasks = []
+                repo_state['pending_tasks'].extend(next_tasks)
+                update_refresh_progress(total_tasks=len(next_tasks), finished_tasks=1)
+
+                if repo_state['pending_tasks'] or repo_state['running_tasks'] > 0:
+                    continue
+                # all the branches are loaded, merge them in the next round
+                if not repo_state['is_merged'] and not repo_state['is_failed'] and repo_state['default_branch']:
+                    repo_state['is_merged'] = True
+                    repo_state['pending_tasks'].append((merge_repo_commits_task, (repo_state,)))
+                    update_refresh_progress(total_tasks=1)
+                    continue
+                active_repo_states.remove(repo_state)
+                is_failed = repo_state['is_failed'] or not repo_state['default_branch']
+                update_refresh_progress(finished_repos=1, failed_repos=1 if is_failed else 0)
+                if is_failed:
+                    if repo_state['branch_watermarks']:
+                        updated_repo_watermarks[repo_state['repo_slug']] = repo_state['branch_watermarks']
+                else:
+                    updated_repo_watermarks[repo_state['repo_slug']] = repo_state['branch_heads']
+
+    save_branch_watermarks(updated_repo_watermarks)
+
+
+def load_repo_branches_task(repo_state, start_time, end_time):
+    base_url = repo_state['base_url']
+    project_key = repo_state['project_key']
+    repo_slug = repo_state['repo_slug']
+    branches = get_branches(base_url, project_key, repo_slug)
+
+    # get the default branch for the repo
+    default_branch = get_default_branch(base_url, project_key, repo_slug)
+    if not default_branch:
+        print(f"Default branch not found for repo {repo_slug}, skip to next repo")
+        return []
+    repo_state['default_branch'] = default_branch
+
+    # if branches has no field 'values', only the default branch is loaded
+    if 'values' not in branches:
+        print(f"Branches not found for repo {repo_slug}, load the default branch only")
+        repo_state['branch_names'] = None
+        return create_fetch_branch_tasks(repo_state, [default_branch])
+
+    move_default_branch_to_first(branches, default_branch)
+    repo_state['branch_names'] = [branch['displayId'] for branch in branches['values']]
+    return create_fetch_branch_tasks(repo_state, branches['values'])
+
+
+def create_fetch_branch_tasks(repo_state, branches):
+    """ create the tasks to fetch the commits of the branches
+    1. if the head (latestCommit) of a branch is the same as its watermark, the branch is skipped, its commits are already in the files
+    2. if the branch has moved, only the commits after the watermark are fetched
+    3. if there's no watermark, or the contribution files are missing, all the commits under period are fetched
+    """
+    branch_watermarks = repo_state['branch_watermarks'] if is_branch_watermark_used(repo_state) else {}
+    tasks = []
+    skipped_branches = 0
+    for branch in branches:
+        branch_name = branch['displayId']
+        latest_commit = branch.get('latestCommit', '')
+        repo_state['branch_heads'][branch_name] = latest_commit
+        watermark = branch_watermarks.get(branch_name)
+        if latest_commit and watermark == latest_commit:
+            repo_state['branch_commits'][branch_name] = ([], True)
+            skipped_branches += 1
+            continue
+        tasks.append((fetch_branch_commits_task, (repo_state, branch_name, watermark)))
+    if skipped_branches:
+        print(f"{skipped_branches} branches of repo {repo_state['repo_slug']} are not changed since the last refresh, skip them")
+        update_refresh_progress(skipped_branches=skipped_branches)
+    return tasks
+
+
+def is_branch_watermark_used(repo_state):
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    if not bb_conf.get('is_incremental_sync', True) or not repo_state['branch_watermarks']:
+        return False
+    # the watermarks are only valid when the commits before them are still in the contribution files
+    repo_slug = repo_state['repo_slug']
+    if not file_tools.is_file_exist(get_contribution_file_path(repo_slug, True)):
+        return False
+    return repo_state['branch_names'] is None or file_tools.is_file_exist(get_contribution_file_path(repo_slug, False))
+
+
+def fetch_branch_commits_task(repo_state, branch_name, since_commit, start_time, end_time):
+    fetch_args = (repo_state['repo_link'], repo_state['base_url'], repo_state['project_key'], repo_state['repo_slug'], branch_name, start_time, end_time)
+    commits, is_success = fetch_branch_commits(*fetch_args, since_commit)
+    # the watermark may be gone after a force push or rebase, fetch the whole branch instead
+    if not is_success and since_commit:
+        print(f"Failed to fetch the commits of branch {branch_name} since {since_commit}, fetch all the commits under period")
+        commits, is_success = fetch_branch_commits(*fetch_args)
+    repo_state['branch_commits'][branch_name] = (commits, is_success)
+    return []
+
+
+def get_branch_watermark_file_path():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{bb_conf.get('branch_watermark_file_path', '/static/bb_contribution_analysis/branch_watermarks.json')}"
+
+
+def get_branch_watermark_key():
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    return 'partial' if bb_conf['is_partial_repos'] else 'all'
+
+
+def load_branch_watermarks():
+    """ get the watermarks of the current repos (partial or all) from the watermark file, with format as below
+    {
+        "partial": {
+            "duration_by_days": 90,
+            "repos": {
+                "167407-web-borrow": {
+                    "master": "5d399c1c80e40d2b2f3469bbe8ea64e5293ab190"     // the latestCommit of the branch in the last refresh
+                }
+            }
+        },
+        "all": {}
+    }
+    the watermarks are dropped when duration_by_days is changed, since the older commits of the new period are not loaded yet
+    """
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    temp_file_path = get_branch_watermark_file_path()
+    if not file_tools.is_file_exist(temp_file_path):
+        return {}
+    watermarks = file_tools.load_json(temp_file_path).get(get_branch_watermark_key(), {})
+    if watermarks.get('duration_by_days') != bb_conf['duration_by_days']:
+        return {}
+    return watermarks.get('repos', {})
+
+
+def save_branch_watermarks(repo_watermarks):
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    temp_file_path = get_branch_watermark_file_path()
+    watermarks = file_tools.load_json(temp_file_path) if file_tools.is_file_exist(temp_file_path) else {}
+    watermarks[get_branch_watermark_key()] = {"duration_by_days": bb_conf['duration_by_days'], "repos": repo_watermarks}
+    file_tools.write_json_to_file_atomically(watermarks, temp_file_path)
+
+
+def merge_repo_commits_task(repo_state, start_time, end_time):
+    repo_slug = repo_state['repo_slug']
+    default_branch_name = repo_state['default_branch']['displayId']
+    branch_commits = repo_state['branch_commits']
+
+    # the default branch is fetched once, and saved into both the default contribution file and the contribution file
+    # a file is only updated when all of its branches are loaded completely, otherwise the existing file is kept
+    default_commits, is_success = branch_commits.get(default_branch_name, ([], False))
+    if is_success:
+        save_repo_commits(repo_slug, [(default_branch_name, default_commits)], start_time, end_time, default_branch_name, True)
+    else:
+        repo_state['is_failed'] = True
+
+    if repo_state['branch_names'] is None:
+        return []
+
+    ordered_branch_commits = []
+    for branch_name in repo_state['branch_names']:
+        commits, is_success = branch_commits.get(branch_name, ([], False))
+        if not is_success:
+            print(f"Commits of branch {branch_name} are not loaded completely, skip updating the commits of repo {repo_slug}")
+            repo_state['is_failed'] = True
+            return []
+        ordered_branch_commits.append((branch_name, commits))
+    save_repo_commits(repo_slug, ordered_branch_commits, start_time, end_time, default_branch_name, False)
+    print(f"Finished loading commits for repo {repo_slug}")
+    return []
+
+
+def try_mark_refresh_running():
+    # check and set is_running in 1 step, so only 1 of the requests coming at the same time can start the refresh
+    with _refresh_progress_lock:
+        if _refresh_progress.get('is_running', False):
+            return False
+        _refresh_progress['is_running'] = True
+        return True
+
+
+def unmark_refresh_running():
+    # the refresh is not started, keep the progress of the last refresh
+    with _refresh_progress_lock:
+        _refresh_progress['is_running'] = False
+
+
+def start_refresh_progress(total_repos):
+    bb_client.reset_metrics()
+    with _refresh_progress_lock:
+        _refresh_progress.clear()
+        _refresh_progress.update({
+            "is_running": True,
+            "phase": "commits",
+            "start_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "end_time": "",
+            "total_repos": total_repos,
+            "finished_repos": 0,
+            "failed_repos": 0,
+            "total_tasks": 0,
+            "finished_tasks": 0,
+            "skipped_branches": 0,
+            "skipped_pr_lookups": 0
+        })
+
+
+def update_refresh_progress(phase=None, **increments):
+    # the numeric fields are increased by the given values, such as finished_tasks=1
+    with _refresh_progress_lock:
+        if phase:
+            _refresh_progress['phase'] = phase
+        for field, increment in increments.items():
+            _refresh_progress[field] = _refresh_progress.get(field, 0) + increment
+
+
+def finish_refresh_progress():
+    with _refresh_progress_lock:
+        _refresh_progress['is_running'] = False
+        _refresh_progress['phase'] = 'finished'
+        _refresh_progress['end_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def get_refresh_progress():
+    with _refresh_progress_lock:
+        return dict(_refresh_progress)
 
 
 def is_allowed_to_refresh():
@@ -714,6 +992,10 @@ def get_refresh_info():
     # if refresh_info.last_refresh_is_partial_repos, get partial_last_refresh_time, otherwise get all_last_refresh_time
     last_refresh_time = refresh_info['partial_last_refresh_time'] if refresh_info['last_refresh_is_partial_repos'] else refresh_info['all_last_refresh_time']
     result['last_refresh_time'] = last_refresh_time
+    # the progress of the running (or last) refresh, it's empty if no refresh since the server started
+    result['progress'] = get_refresh_progress()
+    # the request metrics of each Bitbucket endpoint, and the current rate limit of each host
+    result['client_metrics'] = bb_client.get_metrics()
 
     return {"status": SysConstants.STATUS_SUCCESS.value, "result": result}
 
@@ -985,56 +1267,129 @@ def load_all_default_commit_files(default_commit_files=[]):
 
 
 # write a function to add pr details for each commit
-def add_pr_details_for_commits_thread(commit_files, temp_file_path):
-    # devide the commit_files into multiple parts, run then in parallel for faster speed
-    num_threads = min(5, len(commit_files))
-    commit_files_parts = [commit_files[i::num_threads] for i in range(num_threads)]
-
-    # Create and start threads, each thread starts 1 second after previous one
-    threads = []
-    for i in range(num_threads):
-        # sleep for 1 second before starting the next thread
-        time.sleep(1)
-        thread = threading.Thread(target=add_pr_details_for_commits, args=(commit_files_parts[i], temp_file_path))
-        threads.append(thread)
-        thread.start()
-
-    # Wait for all threads to complete
-    for thread in threads:
-        thread.join()
-
-
-def add_pr_details_for_commits(commit_files, temp_file_path):
-    # iterate the commit files, and get the pr details for each commit
-    for commit_file in commit_files:
-        commits = file_tools.load_json(temp_file_path + '/' + commit_file)
-        for commit in commits:
-            # get base_url, project_key, repo_slug from "commit_link": "https://cedt-gct-bitbucket.nam.nsroot.net/bitbucket/projects/GBMO/repos/167407-web-borrow/commits/39065763c2a6421916b5657abace0dbef1bae9ca",
-            base_url = commit['commit_link'].split('/projects/')[0]
-            project_key = commit['commit_link'].split('projects/')[-1].split('/repos')[0]
-            repo_slug = commit['commit_link'].split('repos/')[-1].split('/commits')[0]
-            commit_id = commit['id']
-            # get the pr details for each commit
-            pr_details, result_flag = get_pull_request_details(base_url, project_key, repo_slug, commit_id)
-            # only when API success, update the pr details to commit, to avoid overwrite the existing pr details with empty array
-            if result_flag:
-                commit['pr_details'] = pr_details
-
-        # get the file name from commit_file, including the ext name
-        temp_file_full_path = f"{temp_file_path}/{commit_file}"
-        # dump the commits with pr details into the same file
-        file_tools.write_json_to_file(commits, temp_file_full_path)
+def add_pr_details_for_commits_thread(commit_files, temp_file_path, pr_details_cache=None):
+    """ the pr details of the commits are loaded by a shared pool of max_workers
+    1. only the commits returned by is_pr_lookup_required are looked up, the others keep their pr details
+    2. pr_details_cache is the pr details found in this refresh, with format {commit_id: pr_details},
+       a commit in the cache isn't looked up again, such as the default branch commits which are in both contribution files
+    3. the commit files are loaded one by one when the pool needs more tasks, at most max_workers * 2 lookups are waiting
+    4. once all the lookups of a file are done, the file is written if any of its commits is changed
+    """
+    pr_details_cache = {} if pr_details_cache is None else pr_details_cache
+    max_workers = bb_client.get_max_workers()
+    max_running_tasks = max_workers * 2
+    pending_commit_files = deque(commit_files)
+    # the file being loaded and its pending lookups, with format {file, commits, remaining_tasks, pending_commits, is_changed}
+    file_states = deque()
+    # the running lookups, with format {future: (file_state, commit)}
+    running_futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending_commit_files or file_states or running_futures:
+            while len(running_futures) < max_running_tasks:
+                # take the next commit file when all the commits of the current files are submitted
+                if (not file_states or not file_states[-1]['pending_commits']) and pending_commit_files:
+                    file_state = load_commit_file_for_pr_lookup(pending_commit_files.popleft(), temp_file_path, pr_details_cache)
+                    file_states.append(file_state)
+                    if file_state['remaining_tasks'] == 0:
+                        finish_commit_file(file_state, file_states, temp_file_path)
+                    continue
+                if not file_states or not file_states[-1]['pending_commits']:
+                    break
+                file_state = file_states[-1]
+                commit = file_state['pending_commits'].popleft()
+                running_futures[executor.submit(add_pr_details_for_commit, commit)] = (file_state, commit)
+
+            if not running_futures:
+                break
+
+            done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                file_state, commit = running_futures.pop(future)
+                try:
+                    if future.result():
+                        file_state['is_changed'] = True
+                        pr_details_cache[commit['id']] = commit['pr_details']
+                except Exception as e:
+                    print(f"Failed to retrieve pull request details for commit file {file_state['file']}: {e}")
+                file_state['remaining_tasks'] -= 1
+                update_refresh_progress(finished_tasks=1)
+                if file_state['remaining_tasks'] == 0:
+                    finish_commit_file(file_state, file_states, temp_file_path)
+
+
+def load_commit_file_for_pr_lookup(commit_file, temp_file_path, pr_details_cache):
+    commits = file_tools.load_json(f"{temp_file_path}/{commit_file}")
+    file_state = {"file": commit_file, "commits": commits, "remaining_tasks": 0, "pending_commits": deque(), "is_changed": False}
+    skipped_count = 0
+    for commit in commits:
+        if not is_pr_lookup_required(commit):
+            # the prs which aren't rechecked can be reused by the same commit in the other file, an empty one may be outdated
+            if commit['pr_details']:
+                pr_details_cache.setdefault(commit['id'], commit['pr_details'])
+            skipped_count += 1
+        elif commit['id'] in pr_details_cache:
+            commit['pr_details'] = pr_details_cache[commit['id']]
+            file_state['is_changed'] = True
+            skipped_count += 1
+        else:
+            file_state['pending_commits'].append(commit)
+    file_state['remaining_tasks'] = len(file_state['pending_commits'])
+    update_refresh_progress(total_tasks=file_state['remaining_tasks'], skipped_pr_lookups=skipped_count)
+    return file_state
+
+
+def is_pr_lookup_required(commit):
+    """ the pr details of a commit are looked up when
+    1. it's added in this refresh or never looked up, so it has no pr_details
+    2. any of its prs is still open, its state, branches and reviewer may change
+    3. it's committed in the last pr_recheck_days days, even if all of its prs are merged or declined,
+       the same commit is raised again in the promotion prs later, such as master to UAT and staging to PROD
+    """
+    pr_details = commit.get('pr_details')
+    if pr_details is None:
+        return True
+    if any(pr_detail.get('state') not in PR_TERMINAL_STATES for pr_detail in pr_details):
+        return True
+    bb_conf = file_tools.load_module_config_file(SysConstants.BB_CONTRIBUTION_ANALYSIS.value)
+    pr_recheck_days = bb_conf.get('pr_recheck_days', 30)
+    return under_period(commit['commit_time'], datetime.now() - timedelta(days=pr_recheck_days), get_tomorrow_midnight())
+
+
+def add_pr_details_for_commit(commit):
+    # get base_url, project_key, repo_slug from "commit_link": "https://cedt-gct-bitbucket.nam.nsroot.net/bitbucket/projects/GBMO/repos/167407-web-borrow/commits/39065763c2a6421916b5657abace0dbef1bae9ca",
+    base_url = commit['commit_link'].split('/projects/')[0]
+    project_key = commit['commit_link'].split('projects/')[-1].split('/repos')[0]
+    repo_slug = commit['commit_link'].split('repos/')[-1].split('/commits')[0]
+    commit_id = commit['id']
+    # get the pr details for each commit
+    pr_details, result_flag = get_pull_request_details(base_url, project_key, repo_slug, commit_id)
+    # only when API success, update the pr details to commit, to avoid overwrite the existing pr details with empty array
+    if result_flag:
+        commit['pr_details'] = pr_details
+    return result_flag
+
+
+def finish_commit_file(file_state, file_states, temp_file_path):
+    file_states.remove(file_state)
+    # dump the commits with pr details into the same file, the file without any change isn't written again
+    if file_state['is_changed']:
+        file_tools.write_json_to_file(file_state['commits'], f"{temp_file_path}/{file_state['file']}")
 
 
 # write a function to update the commit pr details for each commit
 def update_commit_pr_details(default_commit_files=[]):
-    # get all the commit files under /static/bb_contribution_analysis/contribution
-    commit_files, temp_file_path = load_all_commit_files(default_commit_files)
-    add_pr_details_for_commits_thread(commit_files, temp_file_path)
+    update_refresh_progress(phase='pr_details')
+    # the default branch commits are in both the default contribution files and the contribution files,
+    # the default ones are loaded first, so their pr details are reused by the contribution files without looking up again
+    pr_details_cache = {}
 
     # get all the default commit files under /static/bb_contribution_analysis/default_contribution
-    default_commit_files, default_temp_file_path = load_all_default_commit_files(default_commit_files)
-    add_pr_details_for_commits_thread(default_commit_files, default_temp_file_path)
+    default_commit_files_to_update, default_temp_file_path = load_all_default_commit_files(default_commit_files)
+    add_pr_details_for_commits_thread(default_commit_files_to_update, default_temp_file_path, pr_details_cache)
+
+    # get all the commit files under /static/bb_contribution_analysis/contribution
+    commit_files, temp_file_path = load_all_commit_files(default_commit_files)
+    add_pr_details_for_commits_thread(commit_files, temp_file_path, pr_details_cache)
 
 
 def main():
@@ -1053,7 +1408,7 @@ def main():
     # end_date = get_tomorrow_midnight()
     # # set start time as end_time - past_days
     # start_date = end_date - timedelta(days=bb_conf['duration_by_days'])
-    # process_repo_links(['https://cedt-icg-bitbucket.nam.nsroot.net/bitbucket/projects/CONSUMER/repos/gft-ui-mcd/browse'], start_date, end_date)
+    # run_repo_tasks(['https://cedt-icg-bitbucket.nam.nsroot.net/bitbucket/projects/CONSUMER/repos/gft-ui-mcd/browse'], start_date, end_date)
 
     # load commits for all repos
     # load_commits_for_all_repos();
@@ -5,11 +5,27 @@ from common_tools import file_tools
 from consts.sys_constants import SysConstants
 
 
-def get_locations():
+def get_contacts_file_path(field_name):
     # get the json object from file /conf/contacts_config.json
     contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get location file path from the json object, from field 'location_file_path'
-    location_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['location_file_path']}"
+    return f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf[field_name]}"
+
+
+def get_location_file_path():
+    return get_contacts_file_path('location_file_path')
+
+
+def get_person_file_path():
+    return get_contacts_file_path('person_file_path')
+
+
+def get_team_file_path():
+    return get_contacts_file_path('team_file_path')
+
+
+def get_locations():
+    # get location file path from the config, from field 'location_file_path'
+    location_file_path = get_location_file_path()
     # get the array from file location_file_path
     locations = file_tools.load_json(location_file_path)
     # if not locations, return empty list
@@ -19,10 +35,8 @@ def get_locations():
 
 
 def get_persons():
-    # get the json object from file /conf/contacts_config.json
-    contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get person file path from the json object, from field 'person_file_path'
-    person_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['person_file_path']}"
+    # get person file path from the config, from field 'person_file_path'
+    person_file_path = get_person_file_path()
     # get the array from file person_file_path
     persons = file_tools.load_json(person_file_path)
     # if not persons, return empty list
@@ -32,10 +46,8 @@ def get_persons():
 
 
 def get_teams():
-    # get the json object from file /conf/contacts_config.json
-    contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get team file path from the json object, from field 'team_file_path'
-    team_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['team_file_path']}"
+    # get team file path from the config, from field 'team_file_path'
+    team_file_path = get_team_file_path()
     # get the array from file team_file_path
     teams = file_tools.load_json(team_file_path)
     # if not teams, return empty list
@@ -45,32 +57,26 @@ def get_teams():
 
 
 def update_teams(teams):
-    # get the json object from file /conf/contacts_config.json
-    contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get team file path from the json object, from field 'team_file_path'
-    team_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['team_file_path']}"
+    # get team file path from the config, from field 'team_file_path'
+    team_file_path = get_team_file_path()
     # write the array to file team_file_path
     file_tools.write_json_to_file(teams, team_file_path)
 
 
 def update_persons(persons):
-    # get the json object from file /conf/contacts_config.json
-    contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get person file path from the json object, from field 'person_file_path'
-    person_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['person_file_path']}"
+    # get person file path from the config, from field 'person_file_path'
+    person_file_path = get_person_file_path()
     # write the array to file person_file_path
     file_tools.write_json_to_file(persons, person_file_path)
 
 
 def export_person_info_to_excel():
-    # get the json object from file /conf/contacts_config.json
-    contacts_conf = file_tools.load_module_config_file(SysConstants.CONTACTS.value)
-    # get person file path from the json object, from field 'person_file_path'
-    person_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['person_file_path']}"
-    # get location file path from the json object, from field 'location_file_path'
-    location_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['location_file_path']}"
-    # get team file path from the json object, from field 'team_file_path'
-    team_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['team_file_path']}"
+    # get person file path from the config, from field 'person_file_path'
+    person_file_path = get_person_file_path()
+    # get location file path from the config, from field 'location_file_path'
+    location_file_path = get_location_file_path()
+    # get team file path from the config, from field 'team_file_path'
+    team_file_path = get_team_file_path()
 
     # get the array from file person_file_path
     person_data = file_tools.load_json(person_file_path)
@@ -101,5 +107,5 @@ def export_person_info_to_excel():
     final_df.columns = ['ID', 'Name', 'Location Name', 'Remark', 'Team Name', 'Team Remark', 'Team DL']
 
     # Export to Excel
-    person_excel_file_path = f"{SysConstants.PROJECT_BASE_PATH.value}/{contacts_conf['person_excel_file_path']}"
+    person_excel_file_path = get_contacts_file_path('person_excel_file_path')
     final_df.to_excel(person_excel_file_path, index=False)
\ No newline at end of file
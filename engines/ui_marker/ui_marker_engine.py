@@ -1,7 +1,10 @@
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 
-from common_tools import file_tools, string_tools
+from common_tools import file_tools, image_tools, string_tools
 from werkzeug.utils import secure_filename
 from consts.sys_constants import SysConstants
 
@@ -13,6 +16,76 @@ logging.basicConfig(level=logging.INFO, handlers=[
 ])
 log = logging.getLogger(__name__)
 
+# the index of applications / modules / functions, rebuilt whenever the ui_marker config is reloaded
+_application_index = {"config": None, "index": None}
+_application_index_lock = threading.Lock()
+
+# the index of ui_api_relation_data.json, rebuilt whenever the file is reloaded
+_ui_api_relation_index = {"data": None, "index": None}
+_ui_api_relation_index_lock = threading.Lock()
+
+# the locks of the page bundles, with format {page_details_path: lock}, so 2 partial updates of a page don't overwrite each other
+_page_bundle_locks = {}
+_page_bundle_locks_lock = threading.Lock()
+
+# the locks of the summary files, with format {page_summaries_file: lock}, the listings of different functions don't wait for each other
+_page_summaries_locks = {}
+_page_summaries_locks_lock = threading.Lock()
+
+# the thumbnails and previews are generated 1 by 1 in the background, so a replaced image is always processed after the old one
+_image_derivative_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-derivative")
+# the derivatives being generated, with format {(source_file_path, size)}, so the same one isn't queued twice
+_pending_image_derivatives = set()
+_pending_image_derivatives_lock = threading.Lock()
+
+# the listeners of the page changes, each one is called with (application_id, module_id, function_id, page_name)
+_page_change_listeners = []
+
+
+def add_page_change_listener(listener):
+    if listener not in _page_change_listeners:
+        _page_change_listeners.append(listener)
+
+
+def publish_page_change(application_id, module_id, function_id, page_name):
+    # the marker files of the page are changed, the listeners should be quick, such as putting the page into a queue
+    for listener in list(_page_change_listeners):
+        try:
+            listener(application_id, module_id, function_id, page_name)
+        except Exception as e:
+            log.error(f"Failed to publish the change of page {application_id}/{module_id}/{function_id}/{page_name}: {e}")
+
+
+def build_application_index(applications):
+    """build the lookup maps for the application tree, with format as below
+    {
+        "applications": {app_id: application},
+        "modules": {(app_id, module_id): module},
+        "functions": {(app_id, module_id, function_id): function}
+    }
+    """
+    application_map = {}
+    module_map = {}
+    function_map = {}
+    for application in applications:
+        application_map[application["id"]] = application
+        for module in application.get("modules", []):
+            module_map[(application["id"], module["id"])] = module
+            for function in module.get("functions", []):
+                function_map[(application["id"], module["id"], function["id"])] = function
+    return {"applications": application_map, "modules": module_map, "functions": function_map}
+
+
+def get_application_index():
+    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
+    # the cached config object only changes when the config file changes, so rebuild the index at that time
+    with _application_index_lock:
+        if _application_index["config"] is not ui_marker_conf:
+            _application_index["index"] = build_application_index(ui_marker_conf["applications"])
+            _application_index["config"] = ui_marker_conf
+        return _application_index["index"]
+
+
 def get_applications():
     ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
     # get all the applications from the configuration file
@@ -24,12 +97,9 @@ def get_modules_by_application(application_id):
     if application_id is None or application_id == "":
         return {"status": SysConstants.STATUS_FAILED.value, "message": "Please input application name"}
 
-    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
-    # get all the applications from the configuration file
-    applications = ui_marker_conf["applications"]
     # get all the modules from application which has the same id as application_id
-    modules = next((application["modules"] for application in applications if application["id"] == application_id), None)
-    return modules
+    application = get_application_index()["applications"].get(application_id)
+    return application["modules"] if application else None
 
 
 def get_functions_by_module(application_id, module_id):
@@ -39,14 +109,9 @@ def get_functions_by_module(application_id, module_id):
     if module_id is None or module_id == "":
         return {"status": SysConstants.STATUS_FAILED.value, "message": "Please input module name"}
 
-    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
-    # get all the applications from the configuration file
-    applications = ui_marker_conf["applications"]
-    # get the modules from application which has the same id as application_id
-    modules = next((application["modules"] for application in applications if application["id"] == application_id), None)
-    # get all the functions from module which has the same id as module_id
-    functions = next((module["functions"] for module in modules if module["id"] == module_id), None)
-    return functions
+    # get all the functions from module which has the same id as module_id under application_id
+    module = get_application_index()["modules"].get((application_id, module_id))
+    return module["functions"] if module else None
 
 
 def add_page_image(application_id, module_id, function_id, image_file, image_file_name):
@@ -60,7 +125,10 @@ def add_page_image(application_id, module_id, function_id, image_file, image_fil
     file_tools.create_directory_without_remove(image_path)
 
     new_file_name = f"{image_file_name}{extension_name.lower()}"
-    file_tools.create_file(image_file, image_path, new_file_name)
+    # stream the upload into the file, the content hash is kept in the page summary to find the same screenshots
+    content_hash = image_tools.save_image_in_chunks(image_file, os.path.join(image_path, new_file_name))
+    update_page_image_summary(application_id, module_id, function_id, new_file_name, content_hash)
+    schedule_image_derivatives(application_id, module_id, function_id, new_file_name)
     return new_file_name
 
 
@@ -74,7 +142,10 @@ def replace_page_image(application_id, module_id, function_id, image_file, image
     image_path = get_function_page_path(application_id, module_id, function_id)
 
     new_file_name = f"{image_file_name}{extension_name.lower()}"
-    file_tools.replace_existing_file(image_file, image_path, new_file_name)
+    # the existing file is replaced atomically when the whole upload is written
+    content_hash = image_tools.save_image_in_chunks(image_file, os.path.join(image_path, new_file_name))
+    update_page_image_summary(application_id, module_id, function_id, new_file_name, content_hash)
+    schedule_image_derivatives(application_id, module_id, function_id, new_file_name)
     return new_file_name
 
 
@@ -88,35 +159,208 @@ def delete_page(application_id, module_id, function_id, image_file_name):
     # delete the corresponding marker folder
     page_folder_name = image_file_name.split(".")[0]
     file_tools.delete_folder(os.path.join(image_path, page_folder_name))
+    update_page_summary(application_id, module_id, function_id, page_folder_name, removed=True)
+    publish_page_change(application_id, module_id, function_id, page_folder_name)
     return True
 
 
-def get_function_pages(application_id, module_id, function_id):
+def get_function_pages(application_id, module_id, function_id, offset=0, limit=None):
+    """get the images of a function, with the page desc, view type and scope value of each one
+    the page summaries come from the summary file of the function, only the pages not in it yet read their page forms
+    offset and limit are for paging, total is the number of all the images
+    """
     # get all the image file names from folder assets/images/ui_marker/{application_id}/{module_id}/{function_id}
     function_page_path = get_function_page_path(application_id, module_id, function_id)
     if not os.path.exists(function_page_path):
         return {"status": SysConstants.STATUS_FAILED.value, "message": "No image files found"}
-    image_files = os.listdir(function_page_path)
+    # only the files which are not hidden, the file type comes with the directory entry
+    with os.scandir(function_page_path) as entries:
+        image_file_names = [entry.name for entry in entries if not entry.is_dir() and not entry.name.startswith('.')]
+
+    page_summaries = refresh_page_summaries(application_id, module_id, function_id, image_file_names)
+    # the images deleted during the listing are not in the summaries any more
+    image_file_names = [image_file_name for image_file_name in image_file_names if image_file_name in page_summaries]
 
     # get the image file path for UI display
     ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
     image_upload_folder = ui_marker_conf["image_upload_folder"]
-    # verify the type of the files in image_files
-    # only if the file is not a directory, add prefix image_upload_folder to each one in image_files, using string concatenation
-    image_files = [f"{image_upload_folder}/{application_id}/{module_id}/{function_id}/{image_file}" for image_file in image_files if (not os.path.isdir(f"{function_page_path}/{image_file}") and not image_file.startswith('.'))]
+    paged_image_file_names = image_file_names[offset:] if limit is None else image_file_names[offset:offset + limit]
+    image_files = [{"imageFileUri": f"{image_upload_folder}/{application_id}/{module_id}/{function_id}/{image_file_name}",
+                    # the small image for the list, see /ui_marker/page_image
+                    "thumbnailUri": "/ui_marker/page_image?" + urlencode({"applicationId": application_id, "moduleId": module_id, "functionId": function_id,
+                                                                          "pageName": image_file_name.split(".")[0], "size": "thumbnail"}),
+                    **page_summaries[image_file_name]}
+                   for image_file_name in paged_image_file_names]
+    return {"status": SysConstants.STATUS_SUCCESS.value, "image_files": image_files, "total": len(image_file_names)}
+
+
+def get_page_summaries_file_path(application_id, module_id, function_id):
+    # it's a hidden file, so it's not listed as an image
+    function_page_path = get_function_page_path(application_id, module_id, function_id)
+    return f"{function_page_path}/{SysConstants.UI_MARKER_PAGE_SUMMARIES_FILE.value}"
+
+
+def read_page_summary(application_id, module_id, function_id, page_name):
+    # get the page desc from the page form of the page
+    page_details = load_page_form(application_id, module_id, function_id, page_name)
+    return {"pageDesc": page_details.get("page-desc") or '',
+            "pageViewType": page_details.get("page-view-type") or '',
+            "scopeValue": page_details.get("scope-value") or ''}
+
 
-    # get the image desc from {image_upload_folder}/{application_id}/{module_id}/{function_id}/{image_file}/page_form_{image_file}.json
-    for image_file in image_files:
-        page_name = image_file.split("/")[-1].split(".")[0]
-        page_details_file = get_page_details_file_path(application_id, module_id, function_id, page_name)
-        page_details = file_tools.load_json(page_details_file)
-        # if page_details.page-desc is not empty
-        page_desc = page_details.get("page-desc") or ''
-        page_view_type = page_details.get("page-view-type") or ''
-        scope_value= page_details.get("scope-value") or ''
-        image_files[image_files.index(image_file)] = {"imageFileUri": image_file, "pageDesc": page_desc, "pageViewType": page_view_type, "scopeValue": scope_value}
+def _get_page_summaries_lock(page_summaries_file):
+    with _page_summaries_locks_lock:
+        return _page_summaries_locks.setdefault(page_summaries_file, threading.Lock())
 
-    return {"status": SysConstants.STATUS_SUCCESS.value, "image_files": image_files}
+
+def update_page_image_summary(application_id, module_id, function_id, image_file_name, content_hash):
+    # the image is uploaded or replaced, put its content hash in the summary file
+    page_summaries_file = get_page_summaries_file_path(application_id, module_id, function_id)
+    page_summary = {**read_page_summary(application_id, module_id, function_id, image_file_name.split(".")[0]), "contentHash": content_hash}
+    with _get_page_summaries_lock(page_summaries_file):
+        # it will be built by the next listing
+        if not os.path.isfile(page_summaries_file):
+            return
+        page_summaries = file_tools.load_json(page_summaries_file)
+        page_summaries[image_file_name] = page_summary
+        file_tools.write_json_to_file_atomically(page_summaries, page_summaries_file)
+
+
+def find_duplicate_pages(application_id, module_id, function_id, image_file_name):
+    # the other images of the function which have the same content as image_file_name
+    function_page_path = get_function_page_path(application_id, module_id, function_id)
+    with os.scandir(function_page_path) as entries:
+        image_file_names = [entry.name for entry in entries if not entry.is_dir() and not entry.name.startswith('.')]
+    page_summaries = refresh_page_summaries(application_id, module_id, function_id, image_file_names)
+    content_hash = page_summaries.get(image_file_name, {}).get("contentHash")
+    if not content_hash:
+        return []
+    return [other_image_file_name.split(".")[0] for other_image_file_name, page_summary in page_summaries.items()
+            if other_image_file_name != image_file_name and page_summary.get("contentHash") == content_hash]
+
+
+def refresh_page_summaries(application_id, module_id, function_id, image_file_names):
+    """make the summary file of the function match image_file_names, and return it with format as below
+    {
+        "page_20241023050104_mBEm2X.png": {"pageDesc": "...", "pageViewType": "Web", "scopeValue": "...", "contentHash": "sha256 of the image"}
+    }
+    the summaries of the new images are read from their page forms, the ones of the removed images are dropped
+    the images are hashed without the lock, the lock is only held to merge the new summaries into the file
+    the images deleted during the refreshing are skipped, so they may be missing in the returned summaries
+    """
+    function_page_path = get_function_page_path(application_id, module_id, function_id)
+    page_summaries_file = get_page_summaries_file_path(application_id, module_id, function_id)
+    # the file is written atomically, so it can be read without the lock
+    page_summaries = file_tools.load_json(page_summaries_file) if os.path.isfile(page_summaries_file) else {}
+    image_file_name_set = set(image_file_names)
+    # the content hash is calculated only once for each image, then it's updated by the uploading
+    new_page_summaries = {}
+    for image_file_name in image_file_names:
+        if "contentHash" not in page_summaries.get(image_file_name, {}):
+            try:
+                content_hash = image_tools.get_file_hash(f"{function_page_path}/{image_file_name}")
+            except FileNotFoundError:
+                # the image is deleted after it was listed
+                continue
+            new_page_summaries[image_file_name] = {
+                **read_page_summary(application_id, module_id, function_id, image_file_name.split(".")[0]),
+                "contentHash": content_hash
+            }
+    removed_image_file_names = [image_file_name for image_file_name in page_summaries if image_file_name not in image_file_name_set]
+    if not new_page_summaries and not removed_image_file_names:
+        return page_summaries
+
+    with _get_page_summaries_lock(page_summaries_file):
+        # read it again, it may be changed by an upload since it was read
+        page_summaries = file_tools.load_json(page_summaries_file) if os.path.isfile(page_summaries_file) else {}
+        for image_file_name, page_summary in new_page_summaries.items():
+            # the hash put by an upload in the meantime is newer than the one calculated here
+            if "contentHash" not in page_summaries.get(image_file_name, {}):
+                page_summaries[image_file_name] = page_summary
+        for image_file_name in removed_image_file_names:
+            # the image may be uploaded again after it was listed
+            if not os.path.isfile(f"{function_page_path}/{image_file_name}"):
+                page_summaries.pop(image_file_name, None)
+        file_tools.write_json_to_file_atomically(page_summaries, page_summaries_file)
+        return page_summaries
+
+
+def update_page_summary(application_id, module_id, function_id, page_name, removed=False):
+    # keep the summary file up to date when the page form is changed or the page is removed
+    page_summaries_file = get_page_summaries_file_path(application_id, module_id, function_id)
+    page_summary = None if removed else read_page_summary(application_id, module_id, function_id, page_name)
+    with _get_page_summaries_lock(page_summaries_file):
+        # it will be built by the next listing
+        if not os.path.isfile(page_summaries_file):
+            return
+        page_summaries = file_tools.load_json(page_summaries_file)
+        image_file_names = [image_file_name for image_file_name in page_summaries if image_file_name.split(".")[0] == page_name]
+        if not image_file_names:
+            return
+        for image_file_name in image_file_names:
+            if removed:
+                del page_summaries[image_file_name]
+            else:
+                page_summaries[image_file_name].update(page_summary)
+        file_tools.write_json_to_file_atomically(page_summaries, page_summaries_file)
+
+
+def get_image_derivative_file_path(application_id, module_id, function_id, page_name, size):
+    # the derivatives are in the page folder, so they're removed together with the page
+    page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
+    return f"{page_details_path}/{SysConstants.UI_MARKER_PAGE_PREFIX.value}{size}_{page_name}.jpg"
+
+
+def get_page_image_file_path(application_id, module_id, function_id, page_name):
+    # the original image of the page, the extension is the one uploaded
+    function_page_path = get_function_page_path(application_id, module_id, function_id)
+    for extension_name in ['.png', '.jpg', '.jpeg']:
+        image_file_path = f"{function_page_path}/{page_name}{extension_name}"
+        if os.path.isfile(image_file_path):
+            return image_file_path
+    return None
+
+
+def generate_image_derivative(application_id, module_id, function_id, page_name, source_file_path, size):
+    # it's not pending any more once it starts, so the image replaced from now on is queued again
+    with _pending_image_derivatives_lock:
+        _pending_image_derivatives.discard((source_file_path, size))
+    if not os.path.isfile(source_file_path):
+        return
+    max_width, max_height, quality = SysConstants.IMAGE_DERIVATIVE_SIZES.value[size]
+    file_tools.create_directory_without_remove(get_page_details_path(application_id, module_id, function_id, page_name))
+    target_file_path = get_image_derivative_file_path(application_id, module_id, function_id, page_name, size)
+    if image_tools.generate_image_derivative(source_file_path, target_file_path, max_width, max_height, quality):
+        log.info(f"The {size} of page {application_id}/{module_id}/{function_id}/{page_name} is generated")
+
+
+def schedule_image_derivatives(application_id, module_id, function_id, image_file_name, sizes=None):
+    # generate the thumbnail and preview of the page image in the background, nothing to do if Pillow isn't installed
+    if not image_tools.is_image_processing_available():
+        return
+    page_name = image_file_name.split(".")[0]
+    source_file_path = f"{get_function_page_path(application_id, module_id, function_id)}/{image_file_name}"
+    for size in sizes or SysConstants.IMAGE_DERIVATIVE_SIZES.value:
+        with _pending_image_derivatives_lock:
+            if (source_file_path, size) in _pending_image_derivatives:
+                continue
+            _pending_image_derivatives.add((source_file_path, size))
+        _image_derivative_executor.submit(generate_image_derivative, application_id, module_id, function_id, page_name, source_file_path, size)
+
+
+def get_page_image(application_id, module_id, function_id, page_name, size):
+    """get the file path of the page image in the size, return None if the page image doesn't exist
+    the original image is returned if the derivative isn't ready yet, and the derivative is generated in the background
+    """
+    image_file_path = get_page_image_file_path(application_id, module_id, function_id, page_name)
+    if image_file_path is None or size == SysConstants.IMAGE_SIZE_ORIGINAL.value:
+        return image_file_path
+    derivative_file_path = get_image_derivative_file_path(application_id, module_id, function_id, page_name, size)
+    # the derivative is older than the image when the image is replaced and it's not generated again yet
+    if os.path.isfile(derivative_file_path) and os.path.getmtime(derivative_file_path) >= os.path.getmtime(image_file_path):
+        return derivative_file_path
+    schedule_image_derivatives(application_id, module_id, function_id, os.path.basename(image_file_path), [size])
+    return image_file_path
 
 
 def get_function_page_path(application_id, module_id, function_id):
@@ -139,21 +383,19 @@ def get_page_details_path(application_id, module_id, function_id, page_name):
 
 
 def pre_verify(application_id, module_id, function_id):
+    application_index = get_application_index()
     # check if application exists and in the applications list in configuraiton file
-    applications = get_applications()
-    if not any(application["id"] == application_id for application in applications):
+    if application_id not in application_index["applications"]:
         log.warning(f"Invalid application name: {application_id}")
         return {"status": SysConstants.STATUS_FAILED.value, "message": "Invalid application name"}
 
     # check if module exists and in the modules list in configuration file
-    modules = get_modules_by_application(application_id)
-    if not any(module["id"] == module_id for module in modules):
+    if (application_id, module_id) not in application_index["modules"]:
         log.warning(f"Invalid module name: {module_id}")
         return {"status": SysConstants.STATUS_FAILED.value, "message": "Invalid module name"}
 
     # check if function exists and in the functions list in configuration file
-    functions = get_functions_by_module(application_id, module_id)
-    if not any(function["id"] == function_id for function in functions):
+    if (application_id, module_id, function_id) not in application_index["functions"]:
         log.warning(f"Invalid function name: {function_id}")
         return {"status": SysConstants.STATUS_FAILED.value, "message": "Invalid function name"}
 
@@ -167,9 +409,12 @@ def add_page_canvas_marker_details(application_id, module_id, function_id, page_
     # get the function page path from the configuration file
     page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
     page_canvas_marker_details_file = get_page_canvas_file_path(application_id, module_id, function_id, page_name)
+    canvas_marker_details_in_json = file_tools.load_json_from_string(canvas_marker_details)
+    if is_page_bundle_used(application_id, module_id, function_id, page_name):
+        update_page_bundle(application_id, module_id, function_id, page_name, lambda bundle: bundle.update(canvas=canvas_marker_details_in_json))
+        return True
     # create a directory for pate_details_path
     file_tools.create_directory_without_remove(page_details_path)
-    canvas_marker_details_in_json = file_tools.load_json_from_string(canvas_marker_details)
     file_tools.write_json_to_file(canvas_marker_details_in_json, page_canvas_marker_details_file)
     return True
 
@@ -189,10 +434,108 @@ def get_page_details_file_path(application_id, module_id, function_id, page_name
     return f"{page_details_path}/{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_FORM_PREFIX.value}{page_name}.json"
 
 
+def get_page_bundle_file_path(application_id, module_id, function_id, page_name):
+    page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
+    return f"{page_details_path}/{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_BUNDLE_PREFIX.value}{page_name}.json"
+
+
+def is_page_bundle_used(application_id, module_id, function_id, page_name):
+    # the page is written as a bundle in bundle format, or if it's migrated to a bundle already
+    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
+    if ui_marker_conf.get("page_storage_format", "folder") == "bundle":
+        return True
+    return os.path.isfile(get_page_bundle_file_path(application_id, module_id, function_id, page_name))
+
+
+def load_page_bundle(application_id, module_id, function_id, page_name):
+    """load the page bundle which has all the markers of a page in 1 file, return None if the page isn't stored as a bundle
+    {
+        "canvas": {...},        // same as {page_name}.json
+        "pageForm": {...},      // same as page_form_{page_name}.json
+        "elements": {           // same as element_{rect_id}.json
+            "rect_1728290462726": {...}
+        }
+    }
+    """
+    page_bundle_file = get_page_bundle_file_path(application_id, module_id, function_id, page_name)
+    if not os.path.isfile(page_bundle_file):
+        return None
+    page_bundle = file_tools.load_json(page_bundle_file)
+    return {"canvas": page_bundle.get("canvas"), "pageForm": page_bundle.get("pageForm"), "elements": page_bundle.get("elements") or {}}
+
+
+def read_page_folder(application_id, module_id, function_id, page_name):
+    # read the marker files of a page in folder format into the same format as the page bundle
+    page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
+    page_bundle = {"canvas": None, "pageForm": None, "elements": {}}
+    if not os.path.isdir(page_details_path):
+        return page_bundle
+    canvas_file_name = os.path.basename(get_page_canvas_file_path(application_id, module_id, function_id, page_name))
+    page_form_file_name = os.path.basename(get_page_details_file_path(application_id, module_id, function_id, page_name))
+    element_prefix = SysConstants.UI_MARKER_ELEMENT_PREFIX.value
+    with os.scandir(page_details_path) as entries:
+        for entry in entries:
+            if entry.name == canvas_file_name:
+                page_bundle["canvas"] = file_tools.load_json(entry.path) or None
+            elif entry.name == page_form_file_name:
+                page_bundle["pageForm"] = file_tools.load_json(entry.path) or None
+            elif entry.name.startswith(element_prefix) and entry.name.endswith('.json'):
+                page_bundle["elements"][entry.name[len(element_prefix):-len('.json')]] = file_tools.load_json(entry.path)
+    return page_bundle
+
+
+def get_page_bundle(application_id, module_id, function_id, page_name):
+    # all the markers of a page, in the same format whatever the page is stored
+    page_bundle = load_page_bundle(application_id, module_id, function_id, page_name)
+    if page_bundle is None:
+        page_bundle = read_page_folder(application_id, module_id, function_id, page_name)
+    return {"status": SysConstants.STATUS_SUCCESS.value,
+            "canvasMarkerDetails": page_bundle["canvas"],
+            "pageFormDetails": page_bundle["pageForm"],
+            "elementFormDetails": page_bundle["elements"]}
+
+
+def _get_page_bundle_lock(page_details_path):
+    with _page_bundle_locks_lock:
+        return _page_bundle_locks.setdefault(page_details_path, threading.Lock())
+
+
+def update_page_bundle(application_id, module_id, function_id, page_name, update):
+    """change a part of the page bundle by update(page_bundle)
+    the page in folder format is migrated into a bundle first, the small files are removed after the bundle is written
+    """
+    page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
+    with _get_page_bundle_lock(page_details_path):
+        page_bundle = load_page_bundle(application_id, module_id, function_id, page_name)
+        is_migrated = page_bundle is None
+        if is_migrated:
+            page_bundle = read_page_folder(application_id, module_id, function_id, page_name)
+        update(page_bundle)
+        file_tools.create_directory_without_remove(page_details_path)
+        file_tools.write_json_to_file_atomically(page_bundle, get_page_bundle_file_path(application_id, module_id, function_id, page_name))
+        if is_migrated:
+            file_tools.delete_file(get_page_canvas_file_path(application_id, module_id, function_id, page_name))
+            file_tools.delete_file(get_page_details_file_path(application_id, module_id, function_id, page_name))
+            for rect_id in page_bundle["elements"]:
+                file_tools.delete_file(get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id))
+
+
+def migrate_page_to_bundle(application_id, module_id, function_id, page_name):
+    # convert the page folder into a page bundle, return False if it's a bundle already
+    if load_page_bundle(application_id, module_id, function_id, page_name) is not None:
+        return False
+    update_page_bundle(application_id, module_id, function_id, page_name, lambda page_bundle: None)
+    return True
+
+
 def get_page_canvas_marker_details(application_id, module_id, function_id, page_name):
-    # get the function page path from the configuration file
-    page_canvas_marker_details_file = get_page_canvas_file_path(application_id, module_id, function_id, page_name)
-    canvas_marker_details = file_tools.load_json(page_canvas_marker_details_file)
+    page_bundle = load_page_bundle(application_id, module_id, function_id, page_name)
+    if page_bundle is not None:
+        canvas_marker_details = page_bundle["canvas"]
+    else:
+        # get the function page path from the configuration file
+        page_canvas_marker_details_file = get_page_canvas_file_path(application_id, module_id, function_id, page_name)
+        canvas_marker_details = file_tools.load_json(page_canvas_marker_details_file)
     if not canvas_marker_details:
         return {"status": SysConstants.STATUS_FAILED.value, "message": "No page details found"}
     return {"status": SysConstants.STATUS_SUCCESS.value, "canvasMarkerDetails": canvas_marker_details}
@@ -202,6 +545,9 @@ def delete_page_canvas_marker_details(application_id, module_id, function_id, pa
     verify_result = pre_verify(application_id, module_id, function_id)
     if verify_result["status"] == "failed":
         return False
+    if is_page_bundle_used(application_id, module_id, function_id, page_name):
+        update_page_bundle(application_id, module_id, function_id, page_name, lambda page_bundle: page_bundle.update(canvas=None))
+        return True
     # get the function page path from the configuration file
     page_canvas_marker_details_file = get_page_canvas_file_path(application_id, module_id, function_id, page_name)
     file_tools.delete_file(page_canvas_marker_details_file)
@@ -215,10 +561,15 @@ def add_element_form_details(application_id, module_id, function_id, page_name,
     # get the function page path from the configuration file
     page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
     form_details_file = get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id)
-    # create a directory for pate_details_path
-    file_tools.create_directory_without_remove(page_details_path)
     canvas_marker_details_in_json = file_tools.load_json_from_string(form_obj)
-    file_tools.write_json_to_file(canvas_marker_details_in_json, form_details_file)
+    if is_page_bundle_used(application_id, module_id, function_id, page_name):
+        update_page_bundle(application_id, module_id, function_id, page_name,
+                           lambda page_bundle: page_bundle["elements"].update({rect_id: canvas_marker_details_in_json}))
+    else:
+        # create a directory for pate_details_path
+        file_tools.create_directory_without_remove(page_details_path)
+        file_tools.write_json_to_file(canvas_marker_details_in_json, form_details_file)
+    publish_page_change(application_id, module_id, function_id, page_name)
     return True
 
 
@@ -229,26 +580,43 @@ def add_page_form_details(application_id, module_id, function_id, page_name, for
     # get the function page path from the configuration file
     page_details_path = get_page_details_path(application_id, module_id, function_id, page_name)
     form_details_file = get_page_details_file_path(application_id, module_id, function_id, page_name)
-    # create a directory for pate_details_path
-    file_tools.create_directory_without_remove(page_details_path)
     canvas_marker_details_in_json = file_tools.load_json_from_string(form_obj)
-    file_tools.write_json_to_file(canvas_marker_details_in_json, form_details_file)
+    if is_page_bundle_used(application_id, module_id, function_id, page_name):
+        update_page_bundle(application_id, module_id, function_id, page_name, lambda page_bundle: page_bundle.update(pageForm=canvas_marker_details_in_json))
+    else:
+        # create a directory for pate_details_path
+        file_tools.create_directory_without_remove(page_details_path)
+        file_tools.write_json_to_file(canvas_marker_details_in_json, form_details_file)
+    update_page_summary(application_id, module_id, function_id, page_name)
+    publish_page_change(application_id, module_id, function_id, page_name)
     return True
 
 
 def get_element_form_details(application_id, module_id, function_id, page_name, rect_id):
-    # get the function page path from the configuration file
-    form_details_file = get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id)
-    form_details = file_tools.load_json(form_details_file)
+    page_bundle = load_page_bundle(application_id, module_id, function_id, page_name)
+    if page_bundle is not None:
+        form_details = page_bundle["elements"].get(rect_id)
+    else:
+        # get the function page path from the configuration file
+        form_details_file = get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id)
+        form_details = file_tools.load_json(form_details_file)
     if not form_details:
         return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": "NO_CONTENT"}
     return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": form_details}
 
 
-def get_page_form_details(application_id, module_id, function_id, page_name):
+def load_page_form(application_id, module_id, function_id, page_name):
+    # the page form from the page bundle or page_form_{page_name}.json, {} if it doesn't exist
+    page_bundle = load_page_bundle(application_id, module_id, function_id, page_name)
+    if page_bundle is not None:
+        return page_bundle["pageForm"] or {}
     # get the function page form path from the configuration file
     page_details_form_path = get_page_details_file_path(application_id, module_id, function_id, page_name)
-    form_details = file_tools.load_json(page_details_form_path)
+    return file_tools.load_json(page_details_form_path)
+
+
+def get_page_form_details(application_id, module_id, function_id, page_name):
+    form_details = load_page_form(application_id, module_id, function_id, page_name)
     if not form_details:
         return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": "NO_CONTENT"}
     return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": form_details}
@@ -258,34 +626,55 @@ def delete_page_form_details(application_id, module_id, function_id, page_name,
     verify_result = pre_verify(application_id, module_id, function_id)
     if verify_result["status"] == "failed":
         return False
-    # get the function page path from the configuration file
-    form_details_file = get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id)
-    file_tools.delete_file(form_details_file)
+    if is_page_bundle_used(application_id, module_id, function_id, page_name):
+        update_page_bundle(application_id, module_id, function_id, page_name, lambda page_bundle: page_bundle["elements"].pop(rect_id, None))
+    else:
+        # get the function page path from the configuration file
+        form_details_file = get_element_details_file_path(application_id, module_id, function_id, page_name, rect_id)
+        file_tools.delete_file(form_details_file)
+    publish_page_change(application_id, module_id, function_id, page_name)
     return True
 
 
-def get_ui_api_relation(uri, http_method):
-    # Normalize the input URI
-    normalized_input_uri = string_tools.normalize_uri(uri)
-
-    # Get the relation data from ui_api_relation_data.json
+def get_ui_api_relation_file_path():
     ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
     app_base_folder = SysConstants.PROJECT_BASE_PATH.value
     image_upload_folder = ui_marker_conf["image_upload_folder"]
-    ui_api_relation_date_file = SysConstants.UI_MARKER_UI_API_RELATION_FILE.value
-    ui_api_relation_data = file_tools.load_json(f'{app_base_folder}/{image_upload_folder}/{ui_api_relation_date_file}')
+    return f'{app_base_folder}/{image_upload_folder}/{SysConstants.UI_MARKER_UI_API_RELATION_FILE.value}'
 
-    # If no ui_api_relation_data, return empty list
-    if not ui_api_relation_data:
-        return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": []}
 
-    # Filter the ui_api_relation_data by normalized URI and http_method
-    ui_api_relation = [
-        relation for relation in ui_api_relation_data
-        if string_tools.normalize_uri(relation["uri"]) == normalized_input_uri and relation["httpMethod"].lower() == http_method.lower()
-    ]
+def build_ui_api_relation_index(ui_api_relation_data):
+    # group the relations by the normalized URI and the lower-cased http method, with format {(normalized_uri, http_method): [relation]}
+    ui_api_relation_index = {}
+    for relation in ui_api_relation_data or []:
+        key = (string_tools.normalize_uri(relation["uri"]), relation["httpMethod"].lower())
+        ui_api_relation_index.setdefault(key, []).append(relation)
+    return ui_api_relation_index
 
-    if not ui_api_relation:
-        return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": []}
 
-    return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": ui_api_relation}
\ No newline at end of file
+def get_ui_api_relation_index():
+    ui_api_relation_data = file_tools.load_cached_json(get_ui_api_relation_file_path())
+    # the cached data object only changes when ui_api_relation_data.json changes, so rebuild the index at that time
+    with _ui_api_relation_index_lock:
+        if _ui_api_relation_index["data"] is not ui_api_relation_data:
+            _ui_api_relation_index["index"] = build_ui_api_relation_index(ui_api_relation_data)
+            _ui_api_relation_index["data"] = ui_api_relation_data
+        return _ui_api_relation_index["index"]
+
+
+def get_ui_api_relation(uri, http_method):
+    # look up the relations by the normalized URI and http_method
+    ui_api_relation = get_ui_api_relation_index().get((string_tools.normalize_uri(uri), http_method.lower()), [])
+    return {"status": SysConstants.STATUS_SUCCESS.value, "formDetails": ui_api_relation}
+
+
+def get_ui_api_relations(uri_methods):
+    """look up the relations of several APIs in 1 call, uri_methods is a list with format [{"uri": "/cards/{id}", "httpMethod": "GET"}]
+    the result keeps the same order as uri_methods
+    """
+    ui_api_relation_index = get_ui_api_relation_index()
+    relations = [{"uri": uri_method["uri"],
+                  "httpMethod": uri_method["httpMethod"],
+                  "formDetails": ui_api_relation_index.get((string_tools.normalize_uri(uri_method["uri"]), uri_method["httpMethod"].lower()), [])}
+                 for uri_method in uri_methods]
+    return {"status": SysConstants.STATUS_SUCCESS.value, "relations": relations}
\ No newline at end of file
@@ -0,0 +1,51 @@
+"""
+convert the ui marker pages from the folder format into the page bundle format
+1. go through ui_marker_config.json, get all the page folders under [image_upload_folder]/[applicationid]/[moduleid]/[functionid]
+2. for each page folder, put {page}.json, page_form_{page}.json and all the element_{rectId}.json into page_bundle_{page}.json,
+   then remove those small files
+3. the pages which are bundles already are skipped, so it can be run again safely
+set "page_storage_format": "bundle" in ui_marker_config.json to write the new pages as bundles too
+stop the server before running it, the page lock only works inside 1 process, so the pages edited by the server
+during the migration may be lost, it refuses to run without --server-stopped unless it's a dry run
+"""
+import argparse
+import os
+
+from common_tools import file_tools
+from consts.sys_constants import SysConstants
+from engines.ui_marker import ui_marker_engine
+
+
+def migrate_all_pages(dry_run=False):
+    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
+    migrated_count = 0
+    skipped_count = 0
+    for app in ui_marker_conf["applications"]:
+        for module in app['modules']:
+            for function in module['functions']:
+                function_page_path = ui_marker_engine.get_function_page_path(app['id'], module['id'], function['id'])
+                if not os.path.exists(function_page_path):
+                    continue
+                with os.scandir(function_page_path) as entries:
+                    page_names = [entry.name for entry in entries if entry.is_dir()]
+                for page_name in page_names:
+                    if ui_marker_engine.load_page_bundle(app['id'], module['id'], function['id'], page_name) is not None:
+                        skipped_count += 1
+                        continue
+                    if not dry_run:
+                        ui_marker_engine.migrate_page_to_bundle(app['id'], module['id'], function['id'], page_name)
+                    migrated_count += 1
+                    print(f"{'[Dry run] ' if dry_run else ''}page {app['id']}/{module['id']}/{function['id']}/{page_name} is migrated")
+    print(f"{migrated_count} pages are migrated, {skipped_count} pages are bundles already")
+    return migrated_count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert the ui marker page folders into page bundles, "
+                                                 "stop the server first, the pages edited during the migration may be lost")
+    parser.add_argument("--dry-run", action="store_true", help="only print the pages to migrate")
+    parser.add_argument("--server-stopped", action="store_true", help="confirm the server is stopped, it's required unless it's a dry run")
+    args = parser.parse_args()
+    if not args.dry_run and not args.server_stopped:
+        parser.error("stop the server first, then run it with --server-stopped")
+    migrate_all_pages(dry_run=args.dry_run)
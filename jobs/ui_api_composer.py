@@ -76,29 +76,48 @@ then put the above formatted data into an object with below format, then put in
     "data": json data
 }
 7. combine page_data and element_data, write them in a file called 'ui_api_relation_data.json' in the same directory
+8. the extracted data of each page is kept in 'ui_api_relation_manifest.json' with the mtime and size of its json files,
+   only the changed pages are extracted again in the next run
 """
+import argparse
 import os
 import json
+import queue
 import re
+import threading
 from datetime import datetime
 import schedule
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from common_tools import file_tools
 from consts.sys_constants import SysConstants
 from engines.ui_marker import ui_marker_engine
 
+# ui_api_relation_data.json and the manifest are written by the full generation and the page refresh worker, 1 at a time
+_relation_lock = threading.Lock()
+# the keys of the changed pages published by ui_marker_engine
+_page_change_queue = queue.Queue()
+_relation_worker = {"thread": None}
+_relation_worker_lock = threading.Lock()
+
 
 def get_page_ids(base_path, application_id, module_id, function_id):
     path = os.path.join(base_path, application_id, module_id, function_id)
     if not os.path.exists(path):
         return []
-    return [folder for folder in os.listdir(path) if os.path.isdir(os.path.join(path, folder))]
+    # the file type comes with the directory entry, no extra stat for each one
+    with os.scandir(path) as entries:
+        return [entry.name for entry in entries if entry.is_dir()]
 
 
-def read_json_files(base_path, application_id, module_id, function_id, page_id, prefix):
+def read_json_files(base_path, application_id, module_id, function_id, page_id, prefix, file_names=None):
+    # file_names are the files in the page folder if they're listed already
     path = os.path.join(base_path, application_id, module_id, function_id, page_id)
-    json_files = [file for file in os.listdir(path) if file.startswith(prefix) and file.endswith('.json')]
+    if file_names is None:
+        with os.scandir(path) as entries:
+            file_names = [entry.name for entry in entries]
+    json_files = [file for file in file_names if file.startswith(prefix) and file.endswith('.json')]
     data = []
     for json_file in json_files:
         with open(os.path.join(path, json_file), 'r', encoding='utf-8') as file:
@@ -142,10 +161,13 @@ def extract_page_data(static_file_path, json_data, application_id, application_n
     return extracted_data
 
 
-def extract_element_data(static_file_path, json_data, application_id, application_name, module_id, module_name, function_id, function_name, page_id):
+def extract_element_data(static_file_path, json_data, application_id, application_name, module_id, module_name, function_id, function_name, page_id,
+                         form_details=None):
     extracted_data = []
-    page_form_json_file_path = ui_marker_engine.get_page_details_file_path(application_id, module_id, function_id, page_id)
-    form_details = file_tools.load_json(page_form_json_file_path)
+    # form_details is the page form if it's read already
+    if form_details is None:
+        page_form_json_file_path = ui_marker_engine.get_page_details_file_path(application_id, module_id, function_id, page_id)
+        form_details = file_tools.load_json(page_form_json_file_path)
     page_desc = form_details.get('page-desc', '')
     page_view_type = form_details.get('page-view-type', 'Web')
 
@@ -181,41 +203,226 @@ def extract_element_data(static_file_path, json_data, application_id, applicatio
     return extracted_data
 
 
-def generate_ui_api_relation_data():
+def get_page_key(application_id, module_id, function_id, page_id):
+    return f"{application_id}/{module_id}/{function_id}/{page_id}"
+
+
+def get_page_signature(full_path, static_file_path, application_id, application_name, module_id, module_name, function_id, function_name, page_id):
+    """the signature of a page, the page is extracted again only when its signature is changed
+    it includes the names in the output, and the (mtime_ns, size) of the page form, element and page bundle json files
+    """
+    path = os.path.join(full_path, application_id, module_id, function_id, page_id)
+    page_form_prefix = f"{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_FORM_PREFIX.value}"
+    element_prefix = SysConstants.UI_MARKER_ELEMENT_PREFIX.value
+    page_bundle_prefix = f"{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_BUNDLE_PREFIX.value}"
+    files = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.json') and entry.name.startswith((page_form_prefix, element_prefix, page_bundle_prefix)):
+                file_stat = entry.stat()
+                files[entry.name] = [file_stat.st_mtime_ns, file_stat.st_size]
+    return {
+        "staticFilePath": static_file_path,
+        "appName": application_name,
+        "moduleName": module_name,
+        "funName": function_name,
+        "files": files
+    }
+
+
+def compose_page(full_path, static_file_path, application_id, application_name, module_id, module_name, function_id, function_name, page_id,
+                 file_names=None):
+    # extract the page data and element data of 1 page, each json file is read only once
+    page_form_prefix = f"{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_FORM_PREFIX.value}"
+    element_prefix = SysConstants.UI_MARKER_ELEMENT_PREFIX.value
+    page_form_file_name = f"{page_form_prefix}{page_id}.json"
+    path = os.path.join(full_path, application_id, module_id, function_id, page_id)
+    if file_names is None:
+        with os.scandir(path) as entries:
+            file_names = [entry.name for entry in entries]
+    page_bundle_file_name = f"{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_BUNDLE_PREFIX.value}{page_id}.json"
+    if page_bundle_file_name in file_names:
+        # the page is stored as a bundle, convert it into the same format as the small files
+        page_bundle = file_tools.load_json(os.path.join(path, page_bundle_file_name))
+        page_form_json_data = [{"file": page_form_file_name, "data": page_bundle["pageForm"]}] if page_bundle.get("pageForm") else []
+        element_json_data = [{"file": f"{element_prefix}{rect_id}.json", "data": element}
+                             for rect_id, element in (page_bundle.get("elements") or {}).items()]
+    else:
+        page_form_json_data = read_json_files(full_path, application_id, module_id, function_id, page_id, page_form_prefix, file_names)
+        element_json_data = read_json_files(full_path, application_id, module_id, function_id, page_id, element_prefix, file_names)
+    page_data = extract_page_data(static_file_path, page_form_json_data, application_id, application_name, module_id, module_name, function_id, function_name,
+                                  page_id)
+    # the page form of the elements is the one read above
+    form_details = next((item["data"] for item in page_form_json_data if item["file"] == page_form_file_name), {})
+    element_data = extract_element_data(static_file_path, element_json_data, application_id, application_name, module_id, module_name, function_id, function_name,
+                                        page_id, form_details)
+    return page_data, element_data
+
+
+def load_manifest(full_path):
+    """the manifest keeps the signature and the extracted data of each page, with format as below
+    {
+        "GFT/gft-ui-manage-payees/manage-payees/page_20241023050104_mBEm2X": {
+            "signature": {...},     // see get_page_signature
+            "pageData": [...],
+            "elementData": [...]
+        }
+    }
+    """
+    manifest = file_tools.load_json(f'{full_path}/{SysConstants.UI_MARKER_UI_API_RELATION_MANIFEST_FILE.value}')
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def write_relation_data(full_path, manifest):
+    # the output keeps the same order as the full rebuild, all the page data first, then all the element data
+    page_data = []
+    element_data = []
+    for page_entry in manifest.values():
+        page_data.extend(page_entry["pageData"])
+        element_data.extend(page_entry["elementData"])
+    output_data = page_data + element_data
+    file_path = f'{full_path}/{SysConstants.UI_MARKER_UI_API_RELATION_FILE.value}'    # this file should be an existing one
+    # write the output first, if it fails in the middle, the pages are extracted again next time by the old manifest
+    file_tools.write_json_to_file_atomically(output_data, file_path)
+    file_tools.write_json_to_file_atomically(manifest, f'{full_path}/{SysConstants.UI_MARKER_UI_API_RELATION_MANIFEST_FILE.value}')
+
+
+def generate_ui_api_relation_data(full_rebuild=False, workers=None):
+    """generate ui_api_relation_data.json incrementally
+    1. compare the signature of each page with the one in the manifest, only the changed pages are read and extracted again
+    2. the removed pages are dropped from the manifest
+    3. the output is written only when any page is changed, added or removed
+    full_rebuild ignores the manifest and extracts all the pages
+    the folders are listed and the pages are read by a thread pool of workers threads, see composer_workers in ui_marker_config.json
+    """
+    with _relation_lock:
+        _generate_ui_api_relation_data(full_rebuild, workers)
+
+
+def _compose_page_if_changed(full_path, static_file_path, page, old_manifest):
+    # return the manifest entry of the page, and whether it's extracted again
+    application_id, application_name, module_id, module_name, function_id, function_name, page_id = page
+    page_key = get_page_key(application_id, module_id, function_id, page_id)
+    signature = get_page_signature(full_path, static_file_path, application_id, application_name, module_id, module_name,
+                                   function_id, function_name, page_id)
+    page_entry = old_manifest.get(page_key)
+    if page_entry is not None and page_entry.get("signature") == signature:
+        return page_entry, False
+    # the files in the page folder are listed by the signature already
+    page_data, element_data = compose_page(full_path, static_file_path, application_id, application_name, module_id,
+                                           module_name, function_id, function_name, page_id, list(signature["files"]))
+    return {"signature": signature, "pageData": page_data, "elementData": element_data}, True
+
+
+def _generate_ui_api_relation_data(full_rebuild, workers=None):
     ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
     app_base_folder = SysConstants.PROJECT_BASE_PATH.value
     static_file_path = ui_marker_conf["image_upload_folder"]
     full_path = f'{app_base_folder}/{static_file_path}'
     applications = ui_marker_conf["applications"]
-    page_data = []
-    element_data = []
+    workers = workers or ui_marker_conf.get("composer_workers", 8)
+    old_manifest = {} if full_rebuild else load_manifest(full_path)
+    manifest = {}
 
-    for app in applications:
-        application_id = app['id']
-        application_name = app['name']
-        for module in app['modules']:
-            module_id = module['id']
-            module_name = module['name']
-            for function in module['functions']:
-                function_id = function['id']
-                function_name = function['name']
-                page_ids = get_page_ids(full_path, application_id, module_id, function_id)
-                for page_id in page_ids:
-                    page_form_prefix = f"{SysConstants.UI_MARKER_PAGE_PREFIX.value}{SysConstants.UI_MARKER_FORM_PREFIX.value}"
-                    json_data = read_json_files(full_path, application_id, module_id, function_id, page_id, page_form_prefix)
-                    page_data.extend(extract_page_data(static_file_path, json_data, application_id, application_name, module_id, module_name, function_id, function_name, page_id))
-                    element_prefix = SysConstants.UI_MARKER_ELEMENT_PREFIX.value
-                    json_data = read_json_files(full_path, application_id, module_id, function_id, page_id, element_prefix)
-                    element_data.extend(extract_element_data(static_file_path, json_data, application_id, application_name, module_id, module_name, function_id, function_name, page_id))
+    functions = [(app['id'], app['name'], module['id'], module['name'], function['id'], function['name'])
+                 for app in applications for module in app['modules'] for function in module['functions']]
+    # the reading is I/O bound, so the threads help a lot on the networked storage, map() keeps the order of the pages
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        function_page_ids = executor.map(lambda function: get_page_ids(full_path, function[0], function[2], function[4]), functions)
+        pages = [(*function, page_id) for function, page_ids in zip(functions, function_page_ids) for page_id in page_ids]
+        page_results = executor.map(lambda page: _compose_page_if_changed(full_path, static_file_path, page, old_manifest), pages)
+        changed_count = 0
+        for page, (page_entry, is_changed) in zip(pages, page_results):
+            manifest[get_page_key(page[0], page[2], page[4], page[6])] = page_entry
+            changed_count += is_changed
 
-    output_data = page_data + element_data
-    file_path = f'{full_path}/ui_api_relation_data.json'    # this file should be an existing one
-    # write content to file
-    with open(file_path, 'w', encoding='utf-8') as output_file:
-        json.dump(output_data, output_file, indent=4)
-        # print to console
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f'ui_api_relation_data.json was generated at [{current_time}]')
+    removed_count = len(old_manifest.keys() - manifest.keys())
+    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if not changed_count and not removed_count and os.path.exists(f'{full_path}/{SysConstants.UI_MARKER_UI_API_RELATION_FILE.value}'):
+        print(f'ui_api_relation_data.json has no change at [{current_time}]')
+        return
+    write_relation_data(full_path, manifest)
+    # print to console
+    print(f'ui_api_relation_data.json was generated at [{current_time}], {changed_count} pages are extracted, {removed_count} pages are removed')
+
+
+def refresh_pages(page_keys):
+    """apply the changes of the given pages to ui_api_relation_data.json, the other pages are not touched
+    a page is removed from the output if its folder or its function doesn't exist any more
+    """
+    with _relation_lock:
+        ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
+        static_file_path = ui_marker_conf["image_upload_folder"]
+        full_path = f'{SysConstants.PROJECT_BASE_PATH.value}/{static_file_path}'
+        manifest = load_manifest(full_path)
+        if not manifest:
+            # never generated before, the other pages are not in the manifest either
+            _generate_ui_api_relation_data(False)
+            return
+
+        application_index = ui_marker_engine.get_application_index()
+        changed_count = 0
+        for page_key in page_keys:
+            application_id, module_id, function_id, page_id = page_key.split('/')
+            function = application_index["functions"].get((application_id, module_id, function_id))
+            if function is None or not os.path.isdir(os.path.join(full_path, application_id, module_id, function_id, page_id)):
+                if manifest.pop(page_key, None) is not None:
+                    changed_count += 1
+                continue
+            application_name = application_index["applications"][application_id]["name"]
+            module_name = application_index["modules"][(application_id, module_id)]["name"]
+            function_name = function["name"]
+            signature = get_page_signature(full_path, static_file_path, application_id, application_name, module_id, module_name,
+                                           function_id, function_name, page_id)
+            # the page is known as changed, don't trust the signature, the mtime may not change for 2 quick writes
+            page_data, element_data = compose_page(full_path, static_file_path, application_id, application_name, module_id,
+                                                   module_name, function_id, function_name, page_id)
+            manifest[page_key] = {"signature": signature, "pageData": page_data, "elementData": element_data}
+            changed_count += 1
+
+        if changed_count:
+            write_relation_data(full_path, manifest)
+            current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f'ui_api_relation_data.json was refreshed at [{current_time}], {changed_count} pages are changed')
+
+
+def on_page_changed(application_id, module_id, function_id, page_name):
+    # the listener of ui_marker_engine, only queue the page here, it's refreshed by the worker
+    _page_change_queue.put(get_page_key(application_id, module_id, function_id, page_name))
+
+
+def _run_relation_worker():
+    ui_marker_conf = file_tools.load_module_config_file(SysConstants.UI_MARKER.value)
+    # wait this long after the last change, so a burst of changes on the same page is refreshed once
+    quiet_period = ui_marker_conf.get("relation_refresh_quiet_period_in_seconds", 1)
+    # but never wait longer than this, in case the changes keep coming
+    max_delay = ui_marker_conf.get("relation_refresh_max_delay_in_seconds", 10)
+    while True:
+        page_keys = {_page_change_queue.get()}
+        deadline = time.monotonic() + max_delay
+        while True:
+            timeout = min(quiet_period, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            try:
+                page_keys.add(_page_change_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        try:
+            refresh_pages(page_keys)
+        except Exception as e:
+            print(f'Failed to refresh ui_api_relation_data.json for pages {sorted(page_keys)}: {e}')
+
+
+def start_ui_api_relation_worker():
+    # listen to the page changes and refresh ui_api_relation_data.json in the background, it's started only once
+    with _relation_worker_lock:
+        if _relation_worker["thread"] is not None:
+            return
+        ui_marker_engine.add_page_change_listener(on_page_changed)
+        thread = threading.Thread(target=_run_relation_worker, name="ui-api-relation-worker", daemon=True)
+        _relation_worker["thread"] = thread
+        thread.start()
 
 
 def schedule_generate_ui_api_relation_data():
@@ -227,4 +434,8 @@ def schedule_generate_ui_api_relation_data():
 
 
 if __name__ == "__main__":
-    generate_ui_api_relation_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="generate ui_api_relation_data.json")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and extract all the pages again")
+    parser.add_argument("--workers", type=int, help="the number of the threads to read the pages, composer_workers in ui_marker_config.json by default")
+    args = parser.parse_args()
+    generate_ui_api_relation_data(full_rebuild=args.full, workers=args.workers)
\ No newline at end of file